@@ -0,0 +1,115 @@
+from tables import *
+
+#################
+### CONSTANTS ###
+#################
+
+# Squares are numbered like the rows/columns of the uint8 board in main.py :
+# index = i*8 + j, with i = 0 the 8th rank and j = 0 the a file (a8 = 0, h1 = 63)
+
+ASCII_LOWER_START = 97
+BOARD_SIZE = 8
+NB_SQUARES = 64
+
+WHITE = 0
+BLACK = 1
+BOTH = 2
+
+PAWN = 0
+NIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+NO_PIECE = -1
+NO_SQUARE = -1
+
+# A piece code is color*6 + piece type, it indexes the bitboard list of a position
+PIECE_SYMBOLS = 'PNBRQKpnbrqk'
+
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+NOT_FILE_AB = NOT_FILE_A & ~(FILE_A << 1) & FULL
+NOT_FILE_GH = NOT_FILE_H & ~(FILE_A << 6) & FULL
+RANK_8 = 0xFF
+RANK_1 = RANK_8 << 56
+RANK_3 = RANK_8 << 40
+RANK_6 = RANK_8 << 16
+
+#################
+### Functions ###
+#################
+
+def piece_code(color:int, piece_type:int) -> int:
+    return color * 6 + piece_type
+
+def square_name(sq:int) -> str:
+    return f'{chr(ASCII_LOWER_START + (sq & 7))}{BOARD_SIZE - (sq >> 3)}'
+
+def square_index(name:str) -> int:
+    return (BOARD_SIZE - int(name[1])) * 8 + ord(name[0]) - ASCII_LOWER_START
+
+def squares_of(bb:int):
+    # Iterate over the set bits of a bitboard, from a8 to h1
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+def lsb_square(bb:int) -> int:
+    return (bb & -bb).bit_length() - 1
+
+def popcount(bb:int) -> int:
+    return bb.bit_count()
+
+###########################
+###### Attack functions ###
+###########################
+
+# Set-wise attacks of every piece of a bitboard, for a single square the tables are used.
+# "North" is toward the 8th rank, i.e. a shift to the right
+
+def pawn_attacks(bb:int, color:int) -> int:
+    if color == WHITE:
+        return ((bb >> 9) & NOT_FILE_H) | ((bb >> 7) & NOT_FILE_A)
+    return ((bb << 7) & NOT_FILE_H & FULL) | ((bb << 9) & NOT_FILE_A & FULL)
+
+def knight_attacks(bb:int) -> int:
+    return (((bb >> 17) & NOT_FILE_H) | ((bb >> 15) & NOT_FILE_A)
+          | ((bb >> 10) & NOT_FILE_GH) | ((bb >> 6) & NOT_FILE_AB)
+          | ((bb << 17) & NOT_FILE_A) | ((bb << 15) & NOT_FILE_H)
+          | ((bb << 10) & NOT_FILE_AB) | ((bb << 6) & NOT_FILE_GH)) & FULL
+
+def king_attacks(bb:int) -> int:
+    side = ((bb >> 1) & NOT_FILE_H) | ((bb << 1) & NOT_FILE_A)
+    row = bb | side
+    return (side | (row >> 8) | (row << 8)) & FULL
+
+def ray_attacks(sq:int, occ:int, direction:int) -> int:
+    # Squares of the ray up to and including the first piece met
+    ray = RAYS[direction][sq]
+    blockers = ray & occ
+    if blockers:
+        first = (blockers & -blockers).bit_length() - 1 if direction in INCREASING else blockers.bit_length() - 1
+        ray ^= RAYS[direction][first]
+    return ray
+
+def bishop_attacks(sq:int, occ:int) -> int:
+    return (ray_attacks(sq, occ, NORTH_EAST) | ray_attacks(sq, occ, NORTH_WEST)
+          | ray_attacks(sq, occ, SOUTH_EAST) | ray_attacks(sq, occ, SOUTH_WEST))
+
+def rook_attacks(sq:int, occ:int) -> int:
+    return (ray_attacks(sq, occ, NORTH) | ray_attacks(sq, occ, SOUTH)
+          | ray_attacks(sq, occ, EAST) | ray_attacks(sq, occ, WEST))
+
+def queen_attacks(sq:int, occ:int) -> int:
+    return bishop_attacks(sq, occ) | rook_attacks(sq, occ)
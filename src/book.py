@@ -0,0 +1,164 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+from pgn import *
+
+#################
+### CONSTANTS ###
+#################
+
+# Entry of the book file : position hash, packed move, weight. Entries are sorted by hash then move.
+ENTRY_FORMAT = struct.Struct('<QHH')
+ENTRY_SIZE = ENTRY_FORMAT.size
+
+MAX_WEIGHT = 0xFFFF
+DEFAULT_BOOK_PLIES = 16
+
+# Points given to a move by the result of the game, for the player who played it (win, draw, loss)
+RESULT_POINTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1), '*': (1, 1)}
+
+###############
+### Classes ###
+###############
+
+class OpeningBook:
+
+    # Read-only view of a book file through mmap : opening it reads nothing, a lookup touches
+    # only the pages visited by the binary search.
+
+    def __init__(self, path:str) -> None:
+
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size % ENTRY_SIZE:
+            self.file.close()
+            raise ValueError(f'{path} is not a book file (size {size} is not a multiple of {ENTRY_SIZE})')
+        # An empty file cannot be mapped
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.size = size // ENTRY_SIZE
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __enter__(self) -> 'OpeningBook':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def _first_index(self, key:int) -> int:
+        # Index of the first entry whose hash is not lower than the key
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) >> 1
+            if ENTRY_FORMAT.unpack_from(self.data, middle * ENTRY_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key:int) -> list[tuple[int,int]]:
+        # (move, weight) of every entry of a position hash
+        found = []
+        index = self._first_index(key)
+        while index < self.size:
+            entry_key, mv, weight = ENTRY_FORMAT.unpack_from(self.data, index * ENTRY_SIZE)
+            if entry_key != key:
+                break
+            found.append((mv, weight))
+            index += 1
+        return found
+
+    def moves(self, position:Position) -> list[tuple[int,int]]:
+        # Book moves of a position that are legal in it (a hash collision cannot give an illegal move)
+        legal = legal_moves(position)
+        return [(mv, weight) for mv, weight in self.entries(position.hash) if mv in legal and weight]
+
+    def choose(self, position:Position, rng:random.Random=None) -> int:
+        # The heaviest book move, or a random one in proportion of the weights when a generator is given
+        moves = self.moves(position)
+        if not moves:
+            return NULL_MOVE
+        if rng is None:
+            return max(moves, key=lambda entry: entry[1])[0]
+        return rng.choices([mv for mv, _ in moves], weights=[weight for _, weight in moves])[0]
+
+#################
+### Functions ###
+#################
+
+def write_book(weights:dict[tuple[int,int],int], path:str) -> int:
+
+    # Write (hash, move) -> weight as a sorted book file, weights are scaled down to fit in 16 bits
+    top = max(weights.values(), default=0)
+    scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1
+    count = 0
+    with open(path, 'wb') as file:
+        for (key, mv), weight in sorted(weights.items()):
+            weight = int(weight * scale)
+            if weight:
+                file.write(ENTRY_FORMAT.pack(key, mv, weight))
+                count += 1
+    return count
+
+def build_book(lines, path:str, max_plies:int=DEFAULT_BOOK_PLIES, min_games:int=1) -> tuple[int,int]:
+
+    # Build a book from a PGN stream : the first max_plies moves of every game are weighted by the result
+    # of the game for the player who played them. Moves played in fewer than min_games games are dropped.
+    # Return the number of games read and of entries written.
+    weights, counts = {}, {}
+    games = 0
+    for game in read_games(lines):
+        games += 1
+        points = RESULT_POINTS.get(game.result, RESULT_POINTS['*'])
+        try:
+            for ply, (position, mv) in enumerate(replay(game)):
+                if ply >= max_plies:
+                    break
+                entry = (position.hash, mv)
+                weights[entry] = weights.get(entry, 0) + points[position.turn]
+                counts[entry] = counts.get(entry, 0) + 1
+        except ValueError:
+            continue # the moves before the bad one are kept
+    kept = {entry: weight for entry, weight in weights.items() if counts[entry] >= min_games}
+    return games, write_book(kept, path)
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Build an opening book from a PGN file, or look up a position')
+    parser.add_argument('book', help='book file')
+    parser.add_argument('--build', metavar='PGN', help="PGN file to build the book from, '-' for the standard input")
+    parser.add_argument('--plies', type=int, default=DEFAULT_BOOK_PLIES, help='number of moves of each game kept')
+    parser.add_argument('--min-games', type=int, default=1, help='games a move must be played in to be kept')
+    parser.add_argument('--fen', default=STARTING_FEN, help='position to look up')
+    args = parser.parse_args()
+
+    if args.build:
+        start = time.perf_counter()
+        source = sys.stdin if args.build == '-' else open(args.build, encoding='utf-8', errors='replace')
+        with source:
+            games, entries = build_book(source, args.book, args.plies, args.min_games)
+        print(f'{entries} entries from {games} games in {time.perf_counter() - start:.2f}s')
+    else:
+        position = from_fen(args.fen)
+        with OpeningBook(args.book) as book:
+            moves = book.moves(position)
+            total = sum(weight for _, weight in moves)
+            for mv, weight in sorted(moves, key=lambda entry: -entry[1]):
+                print(f'{move_to_san(position, mv):<8} {weight:>6}  {100 * weight / total:5.1f}%')
+            if not moves:
+                print('position not in the book')
@@ -0,0 +1,175 @@
+import argparse
+import contextlib
+import sys
+import time
+
+from notation import *
+from search import *
+
+#################
+### CONSTANTS ###
+#################
+
+DEFAULT_DEPTH = 4
+
+###############
+### Classes ###
+###############
+
+class EpdResult:
+
+    # Analysis of one EPD line, written back as EPD operations (acd : depth, acn : nodes, acs : seconds,
+    # ce : centipawn evaluation, pm : predicted move, pv : predicted variation)
+
+    __slots__ = ('line', 'fen', 'operations', 'depth', 'nodes', 'elapsed', 'score', 'pv', 'solved', 'error')
+
+    def __init__(self, line:str) -> None:
+        self.line = line
+        self.fen = ''
+        self.operations:dict[str,list[str]] = {}
+        self.depth = self.nodes = self.score = 0
+        self.elapsed = 0.
+        self.pv:list[str] = []
+        # None when the line has no best move (bm) nor avoid move (am) to compare with
+        self.solved:bool = None
+        self.error = ''
+
+    def __str__(self) -> str:
+        if self.error:
+            return f'{self.line} ; error : {self.error}'
+        operations = dict(self.operations)
+        operations.update({'acd': [str(self.depth)], 'acn': [str(self.nodes)], 'acs': [f'{self.elapsed:.3f}'],
+                           'ce': [str(self.score)]})
+        # A mate or stalemate has no move to predict, empty operations would not be valid EPD
+        if self.pv:
+            operations.update({'pm': self.pv[:1], 'pv': self.pv})
+        return f'{self.fen} {format_operations(operations)}'
+
+#################
+### Functions ###
+#################
+
+def parse_operations(text:str) -> dict[str,list[str]]:
+
+    # 'bm Nf3 e4; id "WAC 1";' -> {'bm': ['Nf3', 'e4'], 'id': ['"WAC 1"']}, a quoted operand may hold spaces and ';'
+    operations = {}
+    tokens, token, quoted = [], '', False
+    for char in text + ';':
+        if char == '"':
+            quoted = not quoted
+            token += char
+        elif quoted:
+            token += char
+        elif char in ' \t;':
+            if token:
+                tokens.append(token)
+                token = ''
+            if char == ';' and tokens:
+                operations[tokens[0]] = tokens[1:]
+                tokens = []
+        else:
+            token += char
+    if quoted:
+        raise ValueError(f'Unclosed quote in EPD operations : {text!r}')
+    return operations
+
+def format_operations(operations:dict[str,list[str]]) -> str:
+    # Quoted operands were kept with their quotes, so they are written back unchanged
+    return ' '.join(' '.join([opcode] + operands) + ';' for opcode, operands in operations.items())
+
+def parse_epd(line:str) -> tuple[Position,dict[str,list[str]]]:
+
+    # The four position fields of a FEN string followed by operations, hmvc/fmvn give the move counters
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f'EPD line must have at least 4 fields : {line!r}')
+    operations = parse_operations(fields[4]) if len(fields) > 4 else {}
+    position = from_fen(' '.join(fields[:4] + operations.get('hmvc', ['0'])[:1] + operations.get('fmvn', ['1'])[:1]))
+    return position, operations
+
+def read_epd(lines):
+
+    # Lazily yield the stripped EPD lines of an iterable (a file is read line by line), skipping blanks and comments
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+def analyze_line(line:str, max_depth:int=DEFAULT_DEPTH, max_nodes:int=None, max_time:float=None, tt:TranspositionTable=None) -> EpdResult:
+
+    result = EpdResult(line)
+    try:
+        position, result.operations = parse_epd(line)
+    except ValueError as error:
+        result.error = str(error)
+        return result
+    result.fen = to_fen(position, counters=False)
+
+    if tt is not None:
+        tt.clear() # every line is searched from the same state, results do not depend on the order of the file
+    searcher = Search(position, max_depth, max_nodes, max_time, tt)
+    start = time.perf_counter()
+    _, score = searcher.run()
+    result.elapsed = time.perf_counter() - start
+    result.depth, result.nodes, result.score = searcher.depth, searcher.nodes, score
+
+    # Variation in SAN, each move is played to write the next one
+    for mv in searcher.best_pv:
+        result.pv.append(move_to_san(position, mv))
+        move(mv, position)
+    for mv in reversed(searcher.best_pv):
+        undo_move(mv, position)
+
+    predicted = strip_san(result.pv[0]) if result.pv else None
+    if 'bm' in result.operations:
+        result.solved = predicted in [strip_san(san) for san in result.operations['bm']]
+    elif 'am' in result.operations:
+        result.solved = predicted is not None and predicted not in [strip_san(san) for san in result.operations['am']]
+    return result
+
+def analyze_stream(lines, output, max_depth:int=DEFAULT_DEPTH, max_nodes:int=None, max_time:float=None):
+
+    # Analyze the EPD lines one after the other and write each result as soon as it is known.
+    # Only one line is held in memory, the results are also yielded to follow the progress.
+    tt = TranspositionTable()
+    for line in read_epd(lines):
+        result = analyze_line(line, max_depth, max_nodes, max_time, tt)
+        output.write(f'{result}\n')
+        output.flush()
+        yield result
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Analyze every position of an EPD file with a fixed budget')
+    parser.add_argument('epd', help="EPD file, '-' for the standard input")
+    parser.add_argument('--output', '-o', help='file to write the results to (standard output by default)')
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help='depth of the search')
+    parser.add_argument('--nodes', type=int, help='node budget of each search')
+    parser.add_argument('--time', type=float, help='time budget of each search in seconds')
+    args = parser.parse_args()
+
+    depth = args.depth if args.nodes is None and args.time is None else MAX_DEPTH
+
+    count = errors = solved = with_target = nodes = 0
+    start = time.perf_counter()
+    # Only the files opened here are closed, not the standard streams
+    with contextlib.ExitStack() as files:
+        source = sys.stdin if args.epd == '-' else files.enter_context(open(args.epd))
+        output = files.enter_context(open(args.output, 'w')) if args.output else sys.stdout
+        for result in analyze_stream(source, output, depth, args.nodes, args.time):
+            count += 1
+            errors += result.error != ''
+            nodes += result.nodes
+            if result.solved is not None:
+                with_target += 1
+                solved += result.solved
+            if count % 100 == 0:
+                print(f'{count} positions ...', file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print(f'{count} positions ({errors} errors), {solved}/{with_target} solved, {nodes} nodes in {elapsed:.2f}s '
+          f'({int(nodes / elapsed) if elapsed else 0} nps)', file=sys.stderr)
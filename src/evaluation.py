@@ -0,0 +1,147 @@
+from numpy import asarray, frombuffer, unpackbits, where, int8, int32, uint8, ndarray
+
+from position import *
+from psqt import MATERIAL
+
+#################
+### CONSTANTS ###
+#################
+
+# Centipawns per attacked square, only used when mobility is asked for
+MOBILITY_WEIGHT = [0, 4, 3, 2, 1, 0]
+
+# PIECE_SQUARE as an array, with a 13th row of zeros for the empty squares (NO_PIECE = -1)
+PIECE_SQUARE_ARRAY = asarray(PIECE_SQUARE + [[0] * NB_SQUARES], dtype=int32)
+
+# Values used by the static exchange evaluation, the king can take but is never taken
+SEE_VALUES = MATERIAL[:KING] + [20000]
+
+#################
+### Functions ###
+#################
+
+def compute_score(position:Position) -> int:
+    # Material and piece-square sum from scratch, position.score must always be equal to it
+    return sum(PIECE_SQUARE[code][sq] for sq, code in enumerate(position.squares) if code != NO_PIECE)
+
+def mobility(position:Position, color:int) -> int:
+
+    # Squares attacked by each piece, weighted by piece type, without generating any move
+    pieces = position.pieces
+    occ = position.occupancy[BOTH]
+    not_own = FULL ^ position.occupancy[color]
+    offset = color * 6
+    score = MOBILITY_WEIGHT[NIGHT] * popcount(knight_attacks(pieces[offset + NIGHT]) & not_own)
+    for sq in squares_of(pieces[offset + BISHOP]):
+        score += MOBILITY_WEIGHT[BISHOP] * popcount(bishop_attacks(sq, occ) & not_own)
+    for sq in squares_of(pieces[offset + ROOK]):
+        score += MOBILITY_WEIGHT[ROOK] * popcount(rook_attacks(sq, occ) & not_own)
+    for sq in squares_of(pieces[offset + QUEEN]):
+        score += MOBILITY_WEIGHT[QUEEN] * popcount(queen_attacks(sq, occ) & not_own)
+    return score
+
+def evaluate(position:Position, with_mobility:bool=False) -> int:
+
+    # Score for the player to move, O(1) unless the mobility term is asked for
+    score = position.score
+    if with_mobility:
+        score += mobility(position, WHITE) - mobility(position, BLACK)
+    return score if position.turn == WHITE else -score
+
+def see(position:Position, mv:int) -> int:
+
+    # Static exchange evaluation : material won by the player to move if both sides keep taking on the
+    # arrival square with their least valuable piece, each side being free to stop. Pins are ignored.
+    _from, to, flags = mv & 63, (mv >> 6) & 63, mv >> 12
+    pieces = position.pieces
+    occ = position.occupancy[BOTH] ^ (1 << _from)
+    color = position.turn
+
+    if flags == EP_CAPTURE:
+        gains = [SEE_VALUES[PAWN]]
+        occ ^= 1 << (to + (8 if color == WHITE else -8))
+    else:
+        gains = [SEE_VALUES[position.squares[to] % 6] if flags & CAPTURE else 0]
+    on_square = SEE_VALUES[position.squares[_from] % 6]
+    if flags & PROMOTION:
+        on_square = SEE_VALUES[NIGHT + (flags & 3)]
+        gains[0] += on_square - SEE_VALUES[PAWN]
+
+    color ^= 1
+    while True:
+        attackers = attackers_to(position, to, color, occ) & occ
+        if not attackers:
+            break
+        offset = color * 6
+        for piece_type in range(6):
+            bb = attackers & pieces[offset + piece_type]
+            if bb:
+                break
+        if piece_type == KING and attackers_to(position, to, color ^ 1, occ) & occ:
+            break # the king cannot take a defended piece
+        # Taking the piece on the square, then possibly losing the taker
+        gains.append(on_square - gains[-1])
+        on_square = SEE_VALUES[piece_type]
+        occ ^= bb & -bb
+        color ^= 1
+
+    # Each side stops taking when going on loses material
+    while len(gains) > 1:
+        last = gains.pop()
+        gains[-1] = -max(-gains[-1], last)
+    return gains[0]
+
+###############################
+###### Batch of positions ######
+###############################
+
+def position_planes(position:Position) -> ndarray:
+    # 12 x 64 array of 0/1, one plane per piece code
+    data = b''.join(bb.to_bytes(8, 'little') for bb in position.pieces)
+    return unpackbits(frombuffer(data, dtype=uint8), bitorder='little').reshape(12, NB_SQUARES)
+
+def evaluate_batch(positions:ndarray, turns:ndarray=None) -> ndarray:
+
+    # Material and piece-square score of N positions at once, given either as N x 12 x 64 planes
+    # or as N x 8 x 8 boards of piece codes (NO_PIECE for an empty square).
+    # Scores are seen by white, or by the player to move when the N turns are given.
+    positions = asarray(positions)
+    if positions.shape[1:] == (12, NB_SQUARES):
+        scores = positions.reshape(len(positions), 12 * NB_SQUARES).astype(int32) @ PIECE_SQUARE_ARRAY[:12].reshape(-1)
+    elif positions.shape[1:] == (BOARD_SIZE, BOARD_SIZE):
+        codes = positions.reshape(len(positions), NB_SQUARES).astype(int32)
+        scores = PIECE_SQUARE_ARRAY[codes, range(NB_SQUARES)].sum(axis=1)
+    else:
+        raise ValueError(f'expected N x 12 x 64 planes or N x 8 x 8 boards, got {positions.shape}')
+
+    if turns is not None:
+        scores = where(asarray(turns) == WHITE, scores, -scores)
+    return scores
+
+def collect_frontier(position:Position, depth:int) -> tuple[ndarray,ndarray,list[list[int]]]:
+
+    # Leaf positions reached after depth legal moves, as N x 12 x 64 planes,
+    # with the player to move of each leaf and the moves leading to it
+    data = bytearray()
+    turns = []
+    lines = []
+    buffers = [move_buffer() for _ in range(depth + 1)]
+    line = []
+
+    def walk(depth:int) -> None:
+        if depth == 0:
+            for bb in position.pieces:
+                data.extend(bb.to_bytes(8, 'little'))
+            turns.append(position.turn)
+            lines.append(list(line))
+            return
+        buf = buffers[depth]
+        for index in range(generate_legal(position, buf)):
+            mv = buf[index]
+            move(mv, position); line.append(mv)
+            walk(depth - 1)
+            undo_move(mv, position); line.pop()
+
+    walk(depth)
+    planes = unpackbits(frombuffer(bytes(data), dtype=uint8), bitorder='little').reshape(len(turns), 12, NB_SQUARES)
+    return planes, asarray(turns, dtype=int8), lines
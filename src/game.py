@@ -0,0 +1,103 @@
+from notation import *
+
+#################
+### CONSTANTS ###
+#################
+
+# Termination of a game
+CHECKMATE = 'checkmate'
+STALEMATE = 'stalemate'
+REPETITION = 'threefold repetition'
+FIFTY_MOVES = 'fifty-move rule'
+INSUFFICIENT = 'insufficient material'
+
+###############
+### Classes ###
+###############
+
+class Game:
+
+    # One game : its own position (nothing is shared with other games), the moves played in packed and SAN form,
+    # the legal moves of the current position and, once the game is over, its result and termination
+
+    __slots__ = ('start_fen', 'position', 'moves', 'sans', 'legal', 'result', 'termination')
+
+    def __init__(self, fen:str=STARTING_FEN) -> None:
+        self.start_fen = fen
+        self.position = from_fen(fen)
+        self.moves:list[int] = []
+        self.sans:list[str] = []
+        self.legal:list[int] = []
+        self.result = '*'
+        self.termination = ''
+        self._update()
+
+    def copy(self) -> 'Game':
+        game = Game.__new__(Game)
+        game.start_fen = self.start_fen
+        game.position = self.position.copy()
+        game.moves = self.moves[:]
+        game.sans = self.sans[:]
+        game.legal = self.legal[:]
+        game.result = self.result
+        game.termination = self.termination
+        return game
+
+    @property
+    def over(self) -> bool:
+        return self.result != '*'
+
+    def play(self, mv:int) -> str:
+        # Play a legal move and return its SAN, a ValueError is raised for an illegal move or a finished game
+        if self.over:
+            raise ValueError(f'the game is over ({self.termination})')
+        if mv not in self.legal:
+            raise ValueError(f'illegal move {move_name(mv)}')
+        san = move_to_san(self.position, mv, self.legal)
+        move(mv, self.position)
+        self.moves.append(mv)
+        self.sans.append(san)
+        self._update()
+        return san
+
+    def play_name(self, name:str) -> str:
+        # Move given in coordinates (e2e4, e7e8q) or in SAN
+        mv = next((mv for mv in self.legal if move_name(mv) == name), None)
+        if mv is None:
+            mv = san_to_move(self.position, name, self.legal)
+        return self.play(mv)
+
+    def undo(self) -> None:
+        if self.moves:
+            undo_move(self.moves.pop(), self.position)
+            self.sans.pop()
+            self.result, self.termination = '*', ''
+            self._update()
+
+    def adjudicate(self, result:str, termination:str) -> None:
+        self.result, self.termination = result, termination
+
+    def _update(self) -> None:
+        position = self.position
+        self.legal = legal_moves(position)
+        if not self.legal:
+            if is_check(position, position.turn):
+                self.adjudicate('1-0' if position.turn == BLACK else '0-1', CHECKMATE)
+            else:
+                self.adjudicate('1/2-1/2', STALEMATE)
+        elif is_repetition(position, 2):
+            self.adjudicate('1/2-1/2', REPETITION)
+        elif is_fifty_moves(position):
+            self.adjudicate('1/2-1/2', FIFTY_MOVES)
+        elif insufficient_material(position):
+            self.adjudicate('1/2-1/2', INSUFFICIENT)
+
+#################
+### Functions ###
+#################
+
+def insufficient_material(position:Position) -> bool:
+    # No pawn, rook or queen, and at most one minor piece left
+    if any(position.pieces[color * 6 + piece_type] for color in (WHITE, BLACK) for piece_type in (PAWN, ROOK, QUEEN)):
+        return False
+    return popcount(position.occupancy[BOTH]) <= 3
@@ -0,0 +1,202 @@
+import argparse
+import json
+import sys
+import time
+
+#################
+### CONSTANTS ###
+#################
+
+# Functions timed by phase, as (module, owner in the module or None, function name).
+# Nothing is changed until a Profiler is enabled : the originals are swapped for timing wrappers,
+# and put back when it is disabled, so the instrumentation costs nothing the rest of the time.
+PHASES = {
+    'search': [('search', 'Search', 'run')],
+    'generation': [('position', None, 'generate_legal'), ('position', None, 'generate_pseudo'), ('position', None, 'generate_captures'),
+                   ('position', None, 'generate_quiets')],
+    'legality': [('position', None, 'pins'), ('position', None, 'attacked_squares'), ('position', None, 'is_check'), ('position', None, '_ep_is_legal'),
+                 ('position', None, 'is_legal_move'), ('position', None, 'has_legal_move')],
+    'make_unmake': [('position', None, 'move'), ('position', None, 'undo_move')],
+    'evaluation': [('evaluation', None, 'evaluate'), ('evaluation', None, 'see'), ('evaluation', None, 'mobility')],
+    'transposition': [('transposition', 'TranspositionTable', 'probe'), ('transposition', 'TranspositionTable', 'store')],
+    'legacy': [('main', None, 'possible_moves'), ('main', None, 'is_square_attacked'), ('main', None, 'is_check_mate'), ('main', None, 'move'),
+               ('main', None, 'undo_move'), ('main', None, 'get_score_from_board')],
+}
+
+# Statistics of Search read after each run
+SEARCH_COUNTERS = ('nodes', 'qnodes', 'tt_cutoffs', 'cutoffs', 'first_cutoffs')
+
+###############
+### Classes ###
+###############
+
+class Profiler:
+
+    # Calls and cumulative time of each instrumented function, self time of each call stack
+    # (for flame graphs), transposition table hits and search counters.
+    # with Profiler() as profiler: ... then profiler.report(), write_json(), write_collapsed()
+
+    def __init__(self, phases:dict=PHASES) -> None:
+        self.phases = phases
+        self.calls:dict[str,int] = {}
+        self.times:dict[str,float] = {}
+        self.stacks:dict[str,float] = {}
+        self.search = dict.fromkeys(SEARCH_COUNTERS, 0)
+        self.searches = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+
+        self._stack:list[str] = []
+        self._children:list[float] = []
+        self._patched:list[tuple] = []
+
+    def __enter__(self) -> 'Profiler':
+        self.enable()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.disable()
+
+    ###### Wrappers ######
+
+    def _wrap(self, name:str, function):
+
+        calls, times, stacks = self.calls, self.times, self.stacks
+        stack, children = self._stack, self._children
+        calls.setdefault(name, 0)
+        times.setdefault(name, 0.)
+        profiler = self
+
+        def wrapper(*args, **kwargs):
+            stack.append(name)
+            children.append(0.)
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                path = ';'.join(stack)
+                stack.pop()
+                # Self time of the stack : the time of the instrumented calls below is removed
+                stacks[path] = stacks.get(path, 0.) + elapsed - children.pop()
+                if children:
+                    children[-1] += elapsed
+                calls[name] += 1
+                times[name] += elapsed
+            if name == 'TranspositionTable.probe':
+                profiler.tt_probes += 1
+                profiler.tt_hits += result is not None
+            elif name == 'Search.run':
+                profiler.searches += 1
+                for counter in SEARCH_COUNTERS:
+                    profiler.search[counter] += getattr(args[0], counter, 0)
+            return result
+
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    def enable(self) -> None:
+
+        # Star imports copied the functions in other modules : every module holding the same object is patched
+        for specs in self.phases.values():
+            for module_name, owner_name, name in specs:
+                module = sys.modules.get(module_name)
+                if module is None:
+                    continue
+                if owner_name is not None:
+                    owner = getattr(module, owner_name)
+                    original = owner.__dict__[name]
+                    self._patched.append((owner, name, original))
+                    setattr(owner, name, self._wrap(f'{owner_name}.{name}', original))
+                    continue
+                original = getattr(module, name)
+                wrapper = self._wrap(f'{module_name}.{name}', original)
+                for other in list(sys.modules.values()):
+                    if getattr(other, name, None) is original and getattr(other, '__dict__', None) is not None:
+                        self._patched.append((other, name, original))
+                        setattr(other, name, wrapper)
+
+    def disable(self) -> None:
+        while self._patched:
+            owner, name, original = self._patched.pop()
+            setattr(owner, name, original)
+
+    ###### Results ######
+
+    def report(self) -> dict:
+
+        phases = {}
+        for phase, specs in self.phases.items():
+            names = [f'{owner_name or module_name}.{name}' for module_name, owner_name, name in specs]
+            functions = {name: {'calls': self.calls[name], 'time': round(self.times[name], 6)}
+                         for name in names if self.calls.get(name)}
+            if functions:
+                phases[phase] = {'calls': sum(function['calls'] for function in functions.values()),
+                                 'time': round(sum(function['time'] for function in functions.values()), 6),
+                                 'functions': functions}
+
+        search = dict(self.search, searches=self.searches)
+        if self.search['cutoffs']:
+            search['first_move_cutoff_rate'] = round(self.search['first_cutoffs'] / self.search['cutoffs'], 4)
+        return {
+            'phases': phases,
+            'transposition': {'probes': self.tt_probes, 'hits': self.tt_hits,
+                              'hit_rate': round(self.tt_hits / self.tt_probes, 4) if self.tt_probes else 0.,
+                              'cutoffs': self.search['tt_cutoffs']},
+            'search': search,
+        }
+
+    def write_json(self, path:str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+    def write_collapsed(self, path:str) -> None:
+        # One "frame;frame;frame microseconds" line per call stack, the input of flamegraph.pl / speedscope
+        with open(path, 'w') as file:
+            for stack, seconds in sorted(self.stacks.items()):
+                file.write(f'{stack} {max(int(seconds * 1e6), 0)}\n')
+
+    def __str__(self) -> str:
+        lines = []
+        report = self.report()
+        for phase, data in report['phases'].items():
+            lines.append(f'{phase:<30} {data["calls"]:>10} calls  {data["time"]:9.3f}s')
+            for name, function in data['functions'].items():
+                lines.append(f'  {name:<28} {function["calls"]:>10} calls  {function["time"]:9.3f}s')
+        tt = report['transposition']
+        lines.append(f'transposition table : {tt["probes"]} probes, hit rate {100 * tt["hit_rate"]:.1f}%, {tt["cutoffs"]} cutoffs')
+        lines.append('search : ' + ', '.join(f'{key} {value}' for key, value in report['search'].items()))
+        return '\n'.join(lines)
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    import perft
+    from search import *
+
+    parser = argparse.ArgumentParser(description='Profile a search (or a perft) by phase')
+    parser.add_argument('--fen', default=STARTING_FEN)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--perft', action='store_true', help='profile the move generator with perft instead of a search')
+    parser.add_argument('--json', help='file to write the report to')
+    parser.add_argument('--collapsed', help='file to write the collapsed stacks to (flame graph input)')
+    args = parser.parse_args()
+
+    position = from_fen(args.fen)
+    with Profiler() as profiler:
+        start = time.perf_counter()
+        if args.perft:
+            perft.perft(position, args.depth)
+        else:
+            Search(position, args.depth).run()
+        elapsed = time.perf_counter() - start
+
+    print(profiler)
+    print(f'total {elapsed:.2f}s (instrumented)')
+    if args.json:
+        profiler.write_json(args.json)
+    if args.collapsed:
+        profiler.write_collapsed(args.collapsed)
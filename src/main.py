@@ -3,6 +3,10 @@ import re
 from enum  import Enum
 from numpy import zeros, uint8, ndarray
 
+import position as engine
+import tables
+from game import Game, CHECKMATE
+
 #################
 ### CONSTANTS ###
 #################
@@ -16,6 +20,11 @@ GREEN = '\033[92m'
 RED = '\033[91m'
 RESET = '\033[0m'
 
+# Precomputed targets of the pieces as (i,j) indexes, the square i*8+j gives the list
+KNIGHT_TARGETS = [tuple(divmod(sq, BOARD_SIZE) for sq in squares) for squares in tables.KNIGHT_SQUARES]
+KING_TARGETS = [tuple(divmod(sq, BOARD_SIZE) for sq in squares) for squares in tables.KING_SQUARES]
+RAY_TARGETS = [[tuple(divmod(sq, BOARD_SIZE) for sq in squares) for squares in rays] for rays in tables.RAY_SQUARES]
+
 ###############
 ### Classes ###
 ###############
@@ -25,6 +34,7 @@ class GI(Enum):
     TURN = 0
     CHECK = 1
     CHECK_MATE = 2
+    DRAW = 3
 
 class Move:
 
@@ -33,8 +43,7 @@ class Move:
         piece:int,
         take:bool=False, piece_take:int=None,
         upgrade:bool=False, en_passant:bool=False,
-        rook:bool=False, dir_rook:tuple=None, piece_rook:int=None,
-        pot_threat:bool=True) -> None:
+        rook:bool=False, dir_rook:tuple=None, piece_rook:int=None) -> None:
 
         self._from = _from
         self.to = to
@@ -51,8 +60,6 @@ class Move:
         self.dir_rook = dir_rook
         self.piece_rook = piece_rook
 
-        self.pot_threat = pot_threat
-
     def __str__(self) -> str:
         tk = 'x' if self.take else ''
         up = '(up)' if self.upgrade else ''
@@ -94,10 +101,6 @@ class Piece:
     def _pos_to_index(pos:str) -> tuple[int]:
         return (BOARD_SIZE-int(pos[1]),ord(pos[0])-ASCII_LOWER_START)
 
-    @staticmethod
-    def _on_edge(index:tuple[int]) -> bool:
-        return index[0] == 0 or index[0] == 7 or index[1] == 0 or index[1] == 7
-
     def _possible_moves(self, piece_dict:dict, board:ndarray) -> list[Move]:
         pass
 
@@ -119,7 +122,7 @@ class Pawn(Piece):
 
         new_index = (index[0]+self.straight_movements[0],index[1]+self.straight_movements[1])
         while in_bound(new_index) and not board[new_index] and abs(new_index[0]-index[0]) <= lim:
-            psb_mv.append(Move(index, new_index, board[index], upgrade=upgrade, pot_threat=False))
+            psb_mv.append(Move(index, new_index, board[index], upgrade=upgrade))
             new_index = add(new_index, self.straight_movements)
 
         for em, epm in zip(self.eating_movements, self.ep_movements):
@@ -129,8 +132,8 @@ class Pawn(Piece):
                 new_case = board[new_index]; look_case = board[look_index]
                 if new_case and piece_dict[new_case]._color != self._color:
                     psb_mv.append(Move(index, new_index, board[index], take=True, piece_take=new_case,upgrade=upgrade))
-                if index[0] in [3,4] and look_case and piece_dict[look_case]._id == Piece.PAWN and piece_dict[look_case]._color != self._color and len(piece_dict[look_case].moves) == 1:
-                    psb_mv.append(Move(index, look_index, board[index], upgrade=upgrade, take=True, piece_take=look_case, en_passant=True))
+                if index[0] in [3,4] and not new_case and look_case and piece_dict[look_case]._id == Piece.PAWN and piece_dict[look_case]._color != self._color and len(piece_dict[look_case].moves) == 1:
+                    psb_mv.append(Move(index, new_index, board[index], upgrade=upgrade, take=True, piece_take=look_case, en_passant=True))
 
         return psb_mv
 
@@ -138,35 +141,33 @@ class FiniteMovementPiece(Piece):
 
     def __init__(self, id:str, color:str, position:tuple) -> None:
         super().__init__(id, color, position)
-        self.movements:list[tuple] = []
+        self.targets:list[tuple] = []
 
     def _possible_moves(self, piece_dict:dict[int,Piece], board:ndarray) -> list[Move]:
 
         psb_mv = []
         index = self._pos
 
-        for movement in self.movements:
-            new_index = add(index, movement)
-            if in_bound(new_index):
-                new_case = board[new_index]
-                if new_case and piece_dict[new_case]._color != self._color:
-                    psb_mv.append(Move(index, new_index, board[index], take=True, piece_take=new_case))
-                elif not new_case:
-                    psb_mv.append(Move(index, new_index, board[index]))
+        for new_index in self.targets[index[0]*BOARD_SIZE+index[1]]:
+            new_case = board[new_index]
+            if new_case and piece_dict[new_case]._color != self._color:
+                psb_mv.append(Move(index, new_index, board[index], take=True, piece_take=new_case))
+            elif not new_case:
+                psb_mv.append(Move(index, new_index, board[index]))
         return psb_mv
 
 class Night(FiniteMovementPiece):
 
     def __init__(self, color:str, position:tuple=()) -> None:
         super().__init__(Piece.NIGHT, color, position)
-        self.movements = [(2,-1),(2,1),(1,2),(-1,2),(-2,1),(-2,-1),(-1,-2),(1,-2)]
+        self.targets = KNIGHT_TARGETS
 
 class King(FiniteMovementPiece):
     
     def __init__(self, color:str, position:tuple=()) -> None:
         super().__init__(Piece.KING, color, position)
-        self.movements = [(1,1),(-1,1),(-1,-1),(1,-1),(0,1),(0,-1),(1,0),(-1,0)]
-        self.rook_dirs = [(0,1),(0,-1)]
+        self.targets = KING_TARGETS
+        self.rook_dirs = [tables.EAST, tables.WEST]
 
     def _possible_moves(self, piece_dict:dict[int,Piece], board:ndarray) -> list[Move]:
 
@@ -175,12 +176,14 @@ class King(FiniteMovementPiece):
         index = self._pos
         if self.not_moved:
             for dir in self.rook_dirs:
-                new_index = add(index,dir)
-                while 0 < new_index[1] < 7 and not board[new_index]:
-                    new_index = add(new_index,dir)
+                new_index = index
+                for new_index in RAY_TARGETS[dir][index[0]*BOARD_SIZE+index[1]]:
+                    if board[new_index]:
+                        break
                 look_case = board[new_index]
                 if look_case and piece_dict[look_case]._id == Piece.ROOK and piece_dict[look_case].not_moved:
-                    psb_mv.append(Move(index, (index[0]+2*dir[0],index[1]+2*dir[1]), board[index], rook=True, dir_rook=dir, piece_rook=look_case))
+                    dir_rook = tables.DIRECTIONS[dir]
+                    psb_mv.append(Move(index, (index[0]+2*dir_rook[0],index[1]+2*dir_rook[1]), board[index], rook=True, dir_rook=dir_rook, piece_rook=look_case))
         
         return psb_mv
 
@@ -188,38 +191,39 @@ class InfiniteMovementPiece(Piece):
 
     def __init__(self, id:str, color:str, position:tuple) -> None:
         super().__init__(id, color, position)
-        self.directions:list[tuple] = []
+        self.directions:list[int] = []
 
     def _possible_moves(self, piece_dict:dict[int,Piece], board:ndarray) -> list[Move]:
 
         psb_mv = []
         index = self._pos
         for dir in self.directions:
-            new_index = add(index,dir)
-            while in_bound(new_index) and not board[new_index]:
+            for new_index in RAY_TARGETS[dir][index[0]*BOARD_SIZE+index[1]]:
+                new_case = board[new_index]
+                if new_case:
+                    if piece_dict[new_case]._color != self._color:
+                        psb_mv.append(Move(index, new_index, board[index], take=True, piece_take=new_case))
+                    break
                 psb_mv.append(Move(index, new_index, board[index]))
-                new_index = add(new_index,dir)
-            if not self._on_edge(minus(new_index,dir)) and board[new_index] and piece_dict[board[new_index]]._color != self._color:
-                psb_mv.append(Move(index, new_index, board[index], take=True, piece_take=board[new_index]))
         return psb_mv
 
 class Bishop(InfiniteMovementPiece):
 
     def __init__(self, color:str, position:tuple=()) -> None:
         super().__init__(Piece.BISHOP, color, position)
-        self.directions = [(1,1),(-1,1),(-1,-1),(1,-1)]
+        self.directions = list(tables.BISHOP_DIRECTIONS)
 
 class Rook(InfiniteMovementPiece):
 
     def __init__(self, color:str, position:tuple=()) -> None:
         super().__init__(Piece.ROOK, color, position)
-        self.directions = [(0,1),(0,-1),(1,0),(-1,0)]
+        self.directions = list(tables.ROOK_DIRECTIONS)
 
 class Queen(InfiniteMovementPiece):
 
     def __init__(self, color:str, position:tuple=()) -> None:
         super().__init__(Piece.QUEEN, color, position)
-        self.directions = [(1,1),(-1,1),(-1,-1),(1,-1),(0,1),(0,-1),(1,0),(-1,0)]
+        self.directions = list(tables.QUEEN_DIRECTIONS)
 
 #################
 ### Functions ###
@@ -248,8 +252,11 @@ def initialize_position(init_board:list[list[Piece|str]]) -> tuple[dict,ndarray]
     for i, row in enumerate(init_board):
         for j, case in enumerate(row):
             if isinstance(case, Piece):
-                piece_dict[count] = case
-                piece_dict[count]._pos = (i,j)
+                # Each game gets its own pieces, the ones of init_board are only read
+                piece = dic_pieces[case._id](case._color, (i,j))
+                piece.not_moved = case.not_moved
+                piece.moves = list(case.moves)
+                piece_dict[count] = piece
                 board[i,j] = count
                 count += 1
 
@@ -260,6 +267,45 @@ def get_king_pos(turn:str, piece_dict:dict[int,Piece]) -> tuple:
         if piece._id == Piece.KING and piece._color == turn:
             return piece._pos
 
+def is_square_attacked(piece_dict:dict[int,Piece], board:ndarray, square:tuple, by_color:str, empty:tuple=None) -> bool:
+
+    # Look outward from the square for a piece of by_color attacking it : knights and kings on their targets,
+    # pawns on the two cases they take from, and the first piece met on each ray for the sliding pieces.
+    # The case `empty` is seen through (the king leaving its case does not hide the squares behind it).
+    index = square[0]*BOARD_SIZE+square[1]
+
+    for targets, id in ((KNIGHT_TARGETS, Piece.NIGHT), (KING_TARGETS, Piece.KING)):
+        for new_index in targets[index]:
+            case = board[new_index]
+            if case and piece_dict[case]._id == id and piece_dict[case]._color == by_color:
+                return True
+
+    # A pawn takes forward, so its attackers stand one row behind the square
+    row = square[0] + (1 if by_color == Piece.WHITE else -1)
+    for new_index in ((row, square[1]-1), (row, square[1]+1)):
+        if in_bound(new_index):
+            case = board[new_index]
+            if case and piece_dict[case]._id == Piece.PAWN and piece_dict[case]._color == by_color:
+                return True
+
+    for dir in tables.QUEEN_DIRECTIONS:
+        sliders = (Piece.ROOK, Piece.QUEEN) if dir in tables.ROOK_DIRECTIONS else (Piece.BISHOP, Piece.QUEEN)
+        for new_index in RAY_TARGETS[dir][index]:
+            case = board[new_index]
+            if case and new_index != empty:
+                if piece_dict[case]._id in sliders and piece_dict[case]._color == by_color:
+                    return True
+                break
+
+    return False
+
+def is_king_move_safe(move:Move, piece_dict:dict[int,Piece], board:ndarray) -> bool:
+    # The king can neither go to an attacked case nor castle out of, through or into check
+    enemy = opponent(piece_dict[move.piece]._color)
+    if move.rook:
+        return not any(is_square_attacked(piece_dict, board, square, enemy) for square in (move._from, minus(move.to, move.dir_rook), move.to))
+    return not is_square_attacked(piece_dict, board, move.to, enemy, empty=move._from)
+
 ############################
 ###### Main functions ######
 ############################
@@ -267,50 +313,31 @@ def get_king_pos(turn:str, piece_dict:dict[int,Piece]) -> tuple:
 def possible_moves(piece_dict:dict[int,Piece], board:ndarray, turn:str) -> tuple[list[Move],list[Move]]:
 
     # Create two lists, one containing the player moves and another containing the ennemy moves
+    # The moves of the kings are only kept when they do not go to (or castle through) an attacked square
     psb_mv_player:list[Move] = []
     psb_mv_holder:list[Move] = []
-    rook_mv:list[Move] = []
 
     for piece in piece_dict.values():
         if piece.alive:
             mvs = piece._possible_moves(piece_dict, board)
-            rook_mv += [mv for mv in mvs if mv.rook]
+            if piece._id == Piece.KING:
+                mvs = [mv for mv in mvs if is_king_move_safe(mv, piece_dict, board)]
             if piece._color == turn: psb_mv_player += mvs
             else: psb_mv_holder += mvs
 
-    rm_mv:list[Move] = []
-    for mv in rook_mv:
-        loop_lst = psb_mv_holder if piece_dict[mv.piece]._color == turn else psb_mv_player
-        for oth_mv in loop_lst:
-            if (minus(mv.to, mv.dir_rook) == oth_mv.to or mv.to == oth_mv.to) and oth_mv.pot_threat and mv not in rm_mv: 
-                rm_mv.append(mv)
-        
-    for mv in rm_mv:
-        if piece_dict[mv.piece]._color == turn: psb_mv_player.remove(mv)
-        else: psb_mv_holder.remove(mv)
-                    
     return psb_mv_player, psb_mv_holder
 
-def is_check(king_pos:str, holder_moves:list[Move]) -> bool:
+def is_check(piece_dict:dict[int,Piece], board:ndarray, turn:str) -> bool:
     # Return if the current player is in check state
-    for hd_mv in holder_moves:
-        if hd_mv.to == king_pos and hd_mv.pot_threat:
-            return True
-    return False
+    return is_square_attacked(piece_dict, board, get_king_pos(turn, piece_dict), opponent(turn))
 
 def is_check_mate(piece_dict:dict[int,Piece], board:ndarray, game_info:dict, player_moves:list[Move]) -> tuple[bool,list[bool]]:
 
     # Return if the current player is in checkmate state
-    lst_check = []
-    for pl_mv in player_moves:
-        move(pl_mv, piece_dict, board, game_info)
-        king_pos = get_king_pos(piece_dict[pl_mv.piece]._color, piece_dict)
-        hld_mv = possible_moves(piece_dict, board, game_info[GI.TURN])[0]
-        if is_check(king_pos, hld_mv):
-            lst_check.append(pl_mv)
-        undo_move(pl_mv, piece_dict, board, game_info)
-        
-    for mv in lst_check: player_moves.remove(mv)  
+    # Illegal moves are removed using the legal move generator of the bitboard position
+    legal = {(divmod(engine.move_from(mv), BOARD_SIZE), divmod(engine.move_to(mv), BOARD_SIZE))
+             for mv in engine.legal_moves(engine.from_board(piece_dict, board, game_info[GI.TURN]))}
+    player_moves[:] = [mv for mv in player_moves if (mv._from, mv.to) in legal]
     return player_moves == []
 
 def move(move:Move, piece_dict:dict[int,Piece], board:ndarray, game_info:dict) -> None:
@@ -345,6 +372,7 @@ def move(move:Move, piece_dict:dict[int,Piece], board:ndarray, game_info:dict) -
         board[rook_index] = 0
         board[new_rook_index] = move.piece_rook
         piece_rook._pos = new_rook_index
+        piece_rook.moves.append(move)
         piece_rook.not_moved = False # If the rook has already moved, no rook is possible
     
     board[findex] = 0
@@ -370,6 +398,7 @@ def undo_move(move:Move, piece_dict:dict[int,Piece], board:ndarray, game_info:di
     if move.take:
         piece_dict[move.piece_take].alive = True
         if move.en_passant:
+            board[arrival] = 0
             board[arrival[0]-piece_dict[move.piece].dir,arrival[1]] = move.piece_take
         else:
             board[arrival] = move.piece_take
@@ -380,7 +409,14 @@ def undo_move(move:Move, piece_dict:dict[int,Piece], board:ndarray, game_info:di
         piece_dict[key] = convert(piece, move.upgrade_piece)
 
     if move.rook:
-        pass # à faire
+        # The rook goes back to the corner it came from
+        piece_rook = piece_dict[move.piece_rook]
+        rook_index = (arrival[0], BOARD_SIZE-1 if move.dir_rook[1] > 0 else 0)
+        board[piece_rook._pos] = 0
+        board[rook_index] = move.piece_rook
+        piece_rook._pos = rook_index
+        piece_rook.moves.pop(-1)
+        piece_rook.not_moved = not piece_rook.moves
     
     board[departure] = key
 
@@ -432,6 +468,9 @@ def minus(ftpl, stpl) -> tuple:
 def in_bound(pos:tuple) -> bool:
     return -1 < pos[0] < 8 and -1 < pos[1] < 8
 
+def opponent(color:str) -> str:
+    return Piece.BLACK if color == Piece.WHITE else Piece.WHITE
+
 #######################
 ### CONST variables ###
 #######################
@@ -502,25 +541,25 @@ def ask_move() -> tuple[tuple[int], tuple[int]]:
         return (-1,-1) # return un move impossible (pas dans la liste) pour que ça reset l'affichage
     return tuple(map(lambda pos:Piece._pos_to_index(pos), ipt.split(' ')))
 
-def show_board(piece_dict:dict, board:ndarray):
+def show_board(position:engine.Position):
 
     print('   * * * * * * * * * *')
     for i in range(BOARD_SIZE):
         print(f' {BOARD_SIZE-i} *', end=' ')
         for j in range(BOARD_SIZE):
-            if board[i,j]:
-                piece = piece_dict[board[i,j]]
-                col = RED if piece._color == Piece.WHITE else GREEN
-                print(col + piece._id + RESET, end=' ')
+            code = position.squares[i*BOARD_SIZE+j]
+            if code != engine.NO_PIECE:
+                col = RED if code // 6 == engine.WHITE else GREEN
+                print(col + engine.PIECE_SYMBOLS[code].lower() + RESET, end=' ')
             else:
                 print(EMPTY_CASE, end=' ')
         print('*')
     print('   * * * * * * * * * *\n     a b c d e f g h')
 
-def show(piece_dict:dict, board:ndarray, game_info:dict) -> None:
+def show(position:engine.Position, game_info:dict) -> None:
 
         clear()
-        show_board(piece_dict, board)
+        show_board(position)
 
         print('\nTurn : ', end='')
 
@@ -534,6 +573,8 @@ def show(piece_dict:dict, board:ndarray, game_info:dict) -> None:
             ccm_string = f'\n{name} in check'
             if game_info[GI.CHECK_MATE]:
                 ccm_string += ' mate'
+        elif game_info[GI.DRAW]:
+            ccm_string = '\nDraw'
 
         print(col + ccm_string + RESET, end='\n')
 
@@ -543,40 +584,41 @@ def show(piece_dict:dict, board:ndarray, game_info:dict) -> None:
 
 def main():
 
-    ### Initialize board ###
-    piece_dict, board = initialize_position(_INIT_BOARD)
+    ### Initialize game ###
+    game = Game()
+    position = game.position
 
     ### Initialize game information
     game_info = {
         GI.TURN : Piece.WHITE,
         GI.CHECK : False,
-        GI.CHECK_MATE : False
+        GI.CHECK_MATE : False,
+        GI.DRAW : False
     }
 
-    # ### Possible moves ###
-    psb_mv, hd_mv = possible_moves(piece_dict, board, game_info[GI.TURN])
-    king_pos = get_king_pos(game_info[GI.TURN], piece_dict)
-    game_info[GI.CHECK] = is_check(king_pos, hd_mv)
-    game_info[GI.CHECK_MATE] = is_check_mate(piece_dict, board, game_info, psb_mv)
-
     ### Mainloop ###
-    while not game_info[GI.CHECK_MATE]:
+    while True:
+
+        # Stalemate, threefold repetition, the fifty-move rule and insufficient material are draws
+        game_info[GI.TURN] = Piece.WHITE if position.turn == engine.WHITE else Piece.BLACK
+        game_info[GI.CHECK] = engine.is_check(position, position.turn)
+        game_info[GI.CHECK_MATE] = game.termination == CHECKMATE
+        game_info[GI.DRAW] = game.over and not game_info[GI.CHECK_MATE]
+        if game.over:
+            break
 
-        show(piece_dict, board, game_info)
-        print(f"Current board score : {get_score_from_board(piece_dict, psb_mv, hd_mv, game_info[GI.TURN])}")
+        show(position, game_info)
+        print(f"Current board score : {position.score}")
 
         _from, to = ask_move()
-        mv = find_move(_from, to, psb_mv)
+        # Packed moves are wrapped in engine.Move to be looked for like main.Move
+        mv = find_move(_from, to, [engine.Move(mv, position.squares[engine.move_from(mv)]) for mv in game.legal])
 
         if mv is not None:
-            move(mv, piece_dict, board, game_info)
-            psb_mv, hd_mv = possible_moves(piece_dict, board, game_info[GI.TURN])
-            king_pos = get_king_pos(game_info[GI.TURN], piece_dict)
-            game_info[GI.CHECK] = is_check(king_pos, hd_mv)
-            game_info[GI.CHECK_MATE] = is_check_mate(piece_dict, board, game_info, psb_mv)
+            game.play(mv.packed)
 
     ### Show final position and winner ###
-    show(piece_dict, board, game_info)
+    show(position, game_info)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
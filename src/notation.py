@@ -0,0 +1,97 @@
+from position import *
+
+#################
+### CONSTANTS ###
+#################
+
+CASTLE_SAN = {KING_CASTLE: 'O-O', QUEEN_CASTLE: 'O-O-O'}
+SAN_PIECES = {'N': NIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+
+#################
+### Functions ###
+#################
+
+def move_to_san(position:Position, mv:int, moves:list[int]=None) -> str:
+
+    # Standard algebraic notation of a legal move (e.g. Nbd7, exd6, e8=Q+, O-O-O#).
+    # The legal moves of the position can be given when they are already known.
+    if moves is None:
+        moves = legal_moves(position)
+
+    _from, to, flags = move_from(mv), move_to(mv), move_flags(mv)
+    piece_type = position.squares[_from] % 6
+
+    if flags in CASTLE_SAN:
+        san = CASTLE_SAN[flags]
+    elif piece_type == PAWN:
+        san = f'{square_name(_from)[0]}x' if flags & CAPTURE else ''
+        san += square_name(to)
+        if flags & PROMOTION:
+            san += f'={PIECE_SYMBOLS[promotion_type(mv)]}'
+    else:
+        # Same piece type going to the same square : add the file, else the rank, else both
+        others = [move_from(other) for other in moves
+                  if move_to(other) == to and move_from(other) != _from and position.squares[move_from(other)] % 6 == piece_type]
+        name = square_name(_from)
+        if not others:
+            origin = ''
+        elif all(sq & 7 != _from & 7 for sq in others):
+            origin = name[0]
+        elif all(sq >> 3 != _from >> 3 for sq in others):
+            origin = name[1]
+        else:
+            origin = name
+        san = f'{PIECE_SYMBOLS[piece_type]}{origin}{"x" if flags & CAPTURE else ""}{square_name(to)}'
+
+    move(mv, position)
+    if is_check(position, position.turn):
+        san += '#' if not has_legal_move(position) else '+'
+    undo_move(mv, position)
+    return san
+
+def strip_san(san:str) -> str:
+    # SAN without check marks and annotations, to compare moves written by different programs
+    return san.rstrip('+#!?').replace('0', 'O')
+
+def san_to_move(position:Position, san:str, moves:list[int]=None) -> int:
+
+    # Legal move written in SAN, a ValueError is raised if no legal move (or more than one) matches.
+    # Check marks and annotations are ignored, castling can be written with O or 0.
+    if moves is None:
+        moves = legal_moves(position)
+    text = strip_san(san)
+
+    if text in ('O-O', 'O-O-O'):
+        flags = KING_CASTLE if text == 'O-O' else QUEEN_CASTLE
+        matches = [mv for mv in moves if move_flags(mv) == flags]
+    else:
+        promotion = NO_PIECE
+        if '=' in text:
+            text, symbol = text.split('=', 1)
+            promotion = SAN_PIECES.get(symbol, NO_PIECE)
+            if promotion == NO_PIECE:
+                raise ValueError(f'Bad promotion in SAN move : {san!r}')
+        elif len(text) > 2 and text[-1] in SAN_PIECES:
+            text, promotion = text[:-1], SAN_PIECES[text[-1]] # e8Q
+        piece_type = SAN_PIECES[text[0]] if text[:1] in SAN_PIECES else PAWN
+        if piece_type != PAWN:
+            text = text[1:]
+        text = text.replace('x', '').replace('-', '')
+        if len(text) < 2 or text[-2] not in 'abcdefgh' or text[-1] not in '12345678':
+            raise ValueError(f'Bad SAN move : {san!r}')
+        to = square_index(text[-2:])
+        origin = text[:-2] # file and/or rank of the departure square
+
+        matches = []
+        for mv in moves:
+            _from = move_from(mv)
+            if move_to(mv) != to or position.squares[_from] % 6 != piece_type or move_flags(mv) in CASTLE_SAN:
+                continue
+            if (promotion_type(mv) if move_flags(mv) & PROMOTION else NO_PIECE) != promotion:
+                continue
+            if all(char == square_name(_from)[0 if char.isalpha() else 1] for char in origin):
+                matches.append(mv)
+
+    if len(matches) != 1:
+        raise ValueError(f'{"Ambiguous" if matches else "Illegal"} SAN move {san!r} in {to_fen(position)}')
+    return matches[0]
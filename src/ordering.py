@@ -0,0 +1,131 @@
+from array import array
+
+from position import *
+
+#################
+### CONSTANTS ###
+#################
+
+# Ranges of the ordering scores, each kind of move is searched before the next one
+HASH_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 24      # + MVV-LVA
+PROMOTION_SCORE = 1 << 23    # + promoted piece type, quiet promotions only (captures are scored as captures)
+KILLER_SCORE = 1 << 22       # first killer one more than the second
+HISTORY_MAX = 1 << 21        # the history of quiet moves stays below the killers
+
+# Most valuable victim first, then least valuable attacker : the king is the cheapest attacker
+VICTIM_VALUE = [1, 3, 3, 5, 9, 0]
+ATTACKER_ORDER = [1, 2, 3, 4, 5, 0]
+
+###############
+### Classes ###
+###############
+
+class MoveOrdering:
+
+    # Scores of the moves of each ply, killer moves and history of quiet moves of a search.
+    # Scores are written in one preallocated buffer per ply, next to the move buffer of the same ply.
+
+    def __init__(self, max_ply:int) -> None:
+        self.scores = [array('i', bytes(4 * MAX_MOVES)) for _ in range(max_ply + 1)]
+        self.killers = [[NULL_MOVE, NULL_MOVE] for _ in range(max_ply + 1)]
+        # history[color][from | to << 6] : how often a quiet move gave a cutoff, weighted by depth
+        self.history = [[0] * 4096 for _ in range(2)]
+
+    def clear(self) -> None:
+        for killers in self.killers:
+            killers[0] = killers[1] = NULL_MOVE
+        self.history = [[0] * 4096 for _ in range(2)]
+
+    def new_search(self) -> None:
+        # Killers are specific to a position, the history is kept but its weight is lowered
+        for killers in self.killers:
+            killers[0] = killers[1] = NULL_MOVE
+        for table in self.history:
+            for index in range(4096):
+                table[index] >>= 1
+
+    def score_moves(self, position:Position, buf:array, n:int, ply:int, hash_move:int) -> None:
+
+        scores = self.scores[ply]
+        squares = position.squares
+        first_killer, second_killer = self.killers[ply]
+        history = self.history[position.turn]
+
+        for index in range(n):
+            mv = buf[index]
+            flags = mv >> 12
+            if mv == hash_move:
+                score = HASH_SCORE
+            elif flags & CAPTURE:
+                victim = PAWN if flags == EP_CAPTURE else squares[(mv >> 6) & 63] % 6
+                score = CAPTURE_SCORE + VICTIM_VALUE[victim] * 8 - ATTACKER_ORDER[squares[mv & 63] % 6]
+                if flags & PROMOTION:
+                    score += VICTIM_VALUE[NIGHT + (flags & 3)]
+            elif flags & PROMOTION:
+                score = PROMOTION_SCORE + NIGHT + (flags & 3)
+            elif mv == first_killer:
+                score = KILLER_SCORE + 1
+            elif mv == second_killer:
+                score = KILLER_SCORE
+            else:
+                score = history[mv & 4095]
+            scores[index] = score
+
+    def pick(self, buf:array, n:int, ply:int, index:int) -> int:
+
+        # Bring the best remaining move to `index` (selection sort, one step per searched move) :
+        # after a cutoff the moves left are never sorted
+        scores = self.scores[ply]
+        best = index
+        best_score = scores[index]
+        for other in range(index + 1, n):
+            if scores[other] > best_score:
+                best, best_score = other, scores[other]
+        if best != index:
+            buf[index], buf[best] = buf[best], buf[index]
+            scores[index], scores[best] = best_score, scores[index]
+        return buf[index]
+
+    def update(self, position:Position, mv:int, depth:int, ply:int) -> None:
+
+        # A quiet move gave a beta cutoff : it becomes the first killer of the ply and gains history
+        if mv >> 12 & (CAPTURE | PROMOTION):
+            return
+        killers = self.killers[ply]
+        if killers[0] != mv:
+            killers[1] = killers[0]
+            killers[0] = mv
+
+        history = self.history[position.turn]
+        history[mv & 4095] += depth * depth
+        if history[mv & 4095] >= HISTORY_MAX:
+            for table in self.history:
+                for index in range(4096):
+                    table[index] >>= 1
+
+    def staged_moves(self, position:Position, buf:array, ply:int, hash_move:int):
+
+        # Yield the legal moves in stages : hash move, captures by MVV-LVA then promotions, killers, quiet moves
+        # by history. A stage is only generated once the previous ones are searched, so after a cutoff
+        # on the hash move or a capture, the quiet moves are never generated.
+        context = legal_context(position)
+        if hash_move != NULL_MOVE and is_legal_move(position, hash_move, context):
+            yield hash_move
+
+        n = generate_captures(position, buf, 0, context)
+        self.score_moves(position, buf, n, ply, NULL_MOVE)
+        for index in range(n):
+            mv = self.pick(buf, n, ply, index)
+            if mv != hash_move:
+                yield mv
+
+        killers = [mv for mv in self.killers[ply] if mv != NULL_MOVE and mv != hash_move and is_legal_move(position, mv, context)]
+        yield from killers
+
+        n = generate_quiets(position, buf, 0, context)
+        self.score_moves(position, buf, n, ply, NULL_MOVE)
+        for index in range(n):
+            mv = self.pick(buf, n, ply, index)
+            if mv != hash_move and mv not in killers:
+                yield mv
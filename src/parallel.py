@@ -0,0 +1,113 @@
+import argparse
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from search import *
+
+#################
+### CONSTANTS ###
+#################
+
+ROOT_SPLIT = 'split'   # the root moves are shared between the workers
+LAZY_SMP = 'smp'       # every worker searches the whole root through a shared transposition table
+
+#################
+### Functions ###
+#################
+
+###########################
+###### Sub functions ######
+###########################
+
+def _search_task(data:bytes, root_moves:list[int], max_depth:int, max_nodes:int, max_time:float, tt:SharedTranspositionTable=None) -> tuple[list[tuple],int]:
+    # Run in a worker process : the position is rebuilt from its packed form, only the table given is shared.
+    # Return the (depth, move, score) of each completed iteration and the number of nodes.
+    searcher = Search(unpack_position(data), max_depth, max_nodes, max_time, tt, root_moves=root_moves)
+    iterations = []
+    searcher.on_iteration = lambda searcher: iterations.append((searcher.depth, searcher.best_pv[0] if searcher.best_pv else NULL_MOVE, searcher.score))
+    searcher.run()
+    if tt is not None:
+        tt.detach()
+    return iterations, searcher.nodes
+
+def _merge_root_split(results:list[list[tuple]]) -> tuple[int,int]:
+
+    # Scores of groups searched to different depths cannot be compared : each group gives its iteration
+    # at the deepest depth every group completed. A mate score is exact whatever the depth, a group
+    # that ended on one gives its last iteration and does not lower the common depth.
+    def exact(iterations:list[tuple]) -> bool:
+        return abs(iterations[-1][2]) >= MATE_SCORE - MAX_DEPTH
+
+    depth = min((iterations[-1][0] for iterations in results if not exact(iterations)), default=MAX_DEPTH)
+    candidates = [iterations[-1] if exact(iterations) else iterations[depth - 1] for iterations in results]
+    _, mv, score = max(candidates, key=lambda iteration: iteration[2])
+    return mv, score
+
+############################
+###### Main functions ######
+############################
+
+def parallel_search(position:Position, max_depth:int=MAX_DEPTH, max_nodes:int=None, max_time:float=None,
+                    workers:int=None, mode:str=ROOT_SPLIT, executor:Executor=None, nb_buckets:int=DEFAULT_BUCKETS) -> tuple[int,int,int]:
+
+    # Spread the search over several processes and merge the results into one best move.
+    # Return the best move, its score and the total number of nodes.
+    workers = workers or os.cpu_count() or 1
+    data = pack_position(position)
+    root_moves = legal_moves(position)
+    if not root_moves:
+        return NULL_MOVE, -MATE_SCORE if is_check(position, position.turn) else 0, 0
+
+    tt = None
+    if mode == ROOT_SPLIT:
+        groups = [root_moves[index::workers] for index in range(min(workers, len(root_moves)))]
+        nodes = max_nodes // len(groups) if max_nodes is not None else None
+        tasks = [(data, group, max_depth, nodes, max_time) for group in groups]
+    elif mode == LAZY_SMP:
+        # The workers fill the same table, so each one finds the results of the others. Every other
+        # worker stops a depth short of the limit and leaves entries ahead of the ones that go to it.
+        tt = SharedTranspositionTable(nb_buckets)
+        nodes = max_nodes // workers if max_nodes is not None else None
+        tasks = [(data, None, max(1, max_depth - index % 2), nodes, max_time, tt) for index in range(workers)]
+    else:
+        raise ValueError(f'unknown parallel mode {mode!r}')
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        results = [future.result() for future in [executor.submit(_search_task, *task) for task in tasks]]
+    finally:
+        if own_executor:
+            executor.shutdown()
+        if tt is not None:
+            tt.close()
+
+    total_nodes = sum(nodes for _, nodes in results)
+    if mode == ROOT_SPLIT:
+        mv, score = _merge_root_split([iterations for iterations, _ in results])
+    else:
+        # The deepest finished search is the most reliable one
+        _, mv, score = max((iterations[-1] for iterations, _ in results), key=lambda iteration: (iteration[0], iteration[2]))
+    return mv, score, total_nodes
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Search a position on several processes')
+    parser.add_argument('--fen', default='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--mode', choices=[ROOT_SPLIT, LAZY_SMP], default=ROOT_SPLIT)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--nodes', type=int)
+    parser.add_argument('--time', type=float)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    mv, score, nodes = parallel_search(from_fen(args.fen), args.depth, args.nodes, args.time, args.workers, args.mode)
+    elapsed = time.perf_counter() - start
+    print(f'best move {move_name(mv)} score {score} : {nodes} nodes in {elapsed:.2f}s ({int(nodes / elapsed)} nps)')
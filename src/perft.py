@@ -0,0 +1,170 @@
+import argparse
+import time
+from array import array
+
+import main
+from position import *
+
+##########################
+### REFERENCE POSITIONS ###
+##########################
+
+# (name, FEN, node counts from depth 1), counts from the Chess Programming Wiki "Perft Results" page
+REFERENCE_POSITIONS = [
+    ('initial', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+        [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+        [48, 2039, 97862, 4085603]),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+        [14, 191, 2812, 43238, 674624]),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+        [6, 264, 9467, 422333]),
+    ('position 4 mirrored', 'r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1',
+        [6, 264, 9467, 422333]),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+        [44, 1486, 62379, 2103487]),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+        [46, 2079, 89890, 3894594]),
+]
+
+DEFAULT_DEPTH = 3
+
+#################
+### Functions ###
+#################
+
+def perft(position:Position, depth:int, buffers:list[array]=None) -> int:
+
+    # Number of leaf nodes at the given depth, the last ply is only counted.
+    # One preallocated move buffer is used per depth.
+    if depth == 0:
+        return 1
+    if buffers is None:
+        buffers = [move_buffer() for _ in range(depth + 1)]
+
+    buf = buffers[depth]
+    n = generate_legal(position, buf)
+    if depth == 1:
+        return n
+
+    nodes = 0
+    for i in range(n):
+        mv = buf[i]
+        move(mv, position)
+        nodes += perft(position, depth - 1, buffers)
+        undo_move(mv, position)
+    return nodes
+
+def divide(position:Position, depth:int) -> dict[str,int]:
+
+    # Node count under each root move, to find which move differs from a reference engine
+    counts = {}
+    for mv in legal_moves(position):
+        move(mv, position)
+        counts[move_name(mv)] = perft(position, depth - 1)
+        undo_move(mv, position)
+    return counts
+
+def run_reference(max_depth:int=DEFAULT_DEPTH) -> bool:
+
+    all_ok = True
+    total_nodes, total_time = 0, 0.
+
+    for name, fen, counts in REFERENCE_POSITIONS:
+        position = from_fen(fen)
+        for depth, expected in enumerate(counts[:max_depth], start=1):
+            start = time.perf_counter()
+            nodes = perft(position, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes; total_time += elapsed
+
+            ok = nodes == expected
+            all_ok &= ok
+            nps = int(nodes / elapsed) if elapsed else 0
+            status = 'ok' if ok else f'FAILED (expected {expected})'
+            print(f'{name:<20} depth {depth} : {nodes:>9} nodes  {elapsed:7.2f}s  {nps:>8} nps  {status}')
+
+    print(f'\nTotal : {total_nodes} nodes in {total_time:.2f}s ({int(total_nodes / total_time) if total_time else 0} nps)')
+    return all_ok
+
+def legacy_board(fen:str) -> list[list]:
+
+    # Board literal of main.py (like _INIT_BOARD) with the placement of a FEN string.
+    # Pieces that cannot have their first move anymore (castling rights, pawns out of their rank) are given
+    # two unknown past moves, so that undo_move does not mark them as unmoved and they cannot be taken en passant.
+    fields = fen.split()
+    unmoved = {(0,4): 'kq', (7,4): 'KQ', (0,0): 'q', (0,7): 'k', (7,0): 'Q', (7,7): 'K'}
+    rows = []
+    for i, row in enumerate(fields[0].split('/')):
+        rows.append([])
+        for char in row:
+            if char.isdigit():
+                rows[-1] += [main.EMPTY_CASE] * int(char)
+                continue
+            color = main.Piece.WHITE if char.isupper() else main.Piece.BLACK
+            piece = main.dic_pieces[char.lower()](color)
+            index = (i, len(rows[-1]))
+            if char in 'pP':
+                piece.not_moved = i == (6 if char == 'P' else 1)
+            elif char in 'kKrR':
+                piece.not_moved = any(right in fields[2] for right in unmoved.get(index, ''))
+            if not piece.not_moved:
+                piece.moves = [None, None]
+            rows[-1].append(piece)
+    return rows
+
+def _legacy_state(piece_dict:dict, board) -> tuple:
+    pieces = tuple((key, piece._id, piece._pos, piece.alive, piece.not_moved, len(piece.moves)) for key, piece in piece_dict.items())
+    return board.tobytes(), pieces
+
+def check_undo_legacy(piece_dict:dict, board, game_info:dict, depth:int) -> int:
+
+    # Play and undo every move of main.py down to the given depth and check that each
+    # undo_move gives back exactly the same board and pieces. Return the number of moves tried.
+    if depth == 0:
+        return 0
+
+    tried = 0
+    psb_mv = main.possible_moves(piece_dict, board, game_info[main.GI.TURN])[0]
+    for mv in psb_mv:
+        before = _legacy_state(piece_dict, board)
+        main.move(mv, piece_dict, board, game_info)
+        tried += 1 + check_undo_legacy(piece_dict, board, game_info, depth - 1)
+        main.undo_move(mv, piece_dict, board, game_info)
+        if _legacy_state(piece_dict, board) != before:
+            raise AssertionError(f'undo_move of {mv} does not restore the position')
+    return tried
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Count the leaf nodes of the move generator')
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, help='maximum depth for the reference positions')
+    parser.add_argument('--fen', help='count a single position instead of the reference ones')
+    parser.add_argument('--divide', action='store_true', help='with --fen, give the count under each root move')
+    parser.add_argument('--legacy', action='store_true', help='check move/undo_move of main.py instead')
+    args = parser.parse_args()
+
+    if args.legacy:
+        for name, fen, _ in REFERENCE_POSITIONS:
+            turn = main.Piece.WHITE if fen.split()[1] == 'w' else main.Piece.BLACK
+            game_info = {main.GI.TURN: turn, main.GI.CHECK: False, main.GI.CHECK_MATE: False}
+            piece_dict, board = main.initialize_position(legacy_board(fen))
+            print(f'{name:<20} : {check_undo_legacy(piece_dict, board, game_info, args.depth)} moves played and undone')
+    elif args.fen:
+        position = from_fen(args.fen)
+        start = time.perf_counter()
+        if args.divide:
+            counts = divide(position, args.depth)
+            for mv, nodes in counts.items():
+                print(f'{mv} : {nodes}')
+            nodes = sum(counts.values())
+        else:
+            nodes = perft(position, args.depth)
+        elapsed = time.perf_counter() - start
+        print(f'\n{nodes} nodes in {elapsed:.2f}s ({int(nodes / elapsed) if elapsed else 0} nps)')
+    else:
+        exit(0 if run_reference(args.depth) else 1)
@@ -0,0 +1,233 @@
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from notation import *
+
+#################
+### CONSTANTS ###
+#################
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+TAG_REGEX = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments, rest-of-line comments, annotation glyphs and move numbers are not moves
+NOISE_REGEX = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|\d+\.(\.\.)?')
+
+# Tags written first, in this order, with their unknown value
+SEVEN_TAG_ROSTER = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?', 'Result': '*'}
+LINE_LENGTH = 79
+
+# Games sent to the worker processes at the same time, each one waits for a result
+PENDING_PER_WORKER = 16
+
+###############
+### Classes ###
+###############
+
+class PgnGame:
+
+    # Tags and SAN moves of one game, variations and comments are dropped
+
+    __slots__ = ('headers', 'moves', 'result')
+
+    def __init__(self, headers:dict[str,str], moves:list[str], result:str) -> None:
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+
+    def start_position(self) -> Position:
+        # Games starting from a set-up position give it in the FEN tag
+        return from_fen(self.headers.get('FEN', STARTING_FEN))
+
+class ReplayStats:
+
+    # Counters of a replay, merged from the games as they are played back
+
+    def __init__(self) -> None:
+        self.games = 0
+        self.plies = 0
+        self.errors = 0
+        self.results = dict.fromkeys(RESULTS, 0)
+        self.start = time.perf_counter()
+
+    def add(self, plies:int, result:str, error:str) -> None:
+        self.games += 1
+        self.plies += plies
+        self.errors += error != ''
+        self.results[result if result in self.results else '*'] += 1
+
+    def __str__(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        games_per_second = self.games / elapsed if elapsed else 0.
+        results = ', '.join(f'{result} : {count}' for result, count in self.results.items())
+        return (f'{self.games} games ({self.errors} with errors), {self.plies} moves in {elapsed:.2f}s '
+                f'({games_per_second:.1f} games/s) - {results}')
+
+#################
+### Functions ###
+#################
+
+###########################
+###### Sub functions ######
+###########################
+
+def _strip_variations(text:str) -> str:
+    # Remove the (possibly nested) variations between parentheses
+    kept, level = [], 0
+    for char in text:
+        if char == '(':
+            level += 1
+        elif char == ')':
+            level = max(level - 1, 0)
+        elif level == 0:
+            kept.append(char)
+    return ''.join(kept)
+
+def _escape(value:str) -> str:
+    # Quotes and backslashes of a tag value are escaped with a backslash
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+def _replay_task(text:str) -> tuple[int,str,str]:
+    # Run in a worker process : parse and replay one game, return its number of plies, result and error
+    game = parse_game(text)
+    plies, error = 0, ''
+    try:
+        for plies, _ in enumerate(replay(game), start=1):
+            pass
+    except ValueError as exception:
+        error = str(exception)
+    return plies, game.result, error
+
+############################
+###### Main functions ######
+############################
+
+def read_game_texts(lines):
+
+    # Lazily split a PGN stream into the text of each game : a tag line after some movetext starts a new game.
+    # Only the lines of the current game are kept, so files of any size are read with bounded memory.
+    game, has_moves = [], False
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('[') and has_moves:
+            yield ''.join(game)
+            game, has_moves = [], False
+        if stripped and not stripped.startswith('[') and not stripped.startswith('%'):
+            has_moves = True
+        game.append(line)
+    if has_moves or any(line.strip() for line in game):
+        yield ''.join(game)
+
+def parse_game(text:str) -> PgnGame:
+
+    headers, movetext = {}, []
+    for line in text.splitlines(keepends=True):
+        match = TAG_REGEX.match(line.strip()) if line.lstrip().startswith('[') else None
+        if match:
+            headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+        elif not line.startswith('%'):
+            movetext.append(line)
+
+    tokens = _strip_variations(NOISE_REGEX.sub(' ', ''.join(movetext))).split()
+    result = headers.get('Result', '*')
+    if tokens and tokens[-1] in RESULTS:
+        result = tokens.pop()
+    return PgnGame(headers, tokens, result)
+
+def format_game(game:PgnGame) -> str:
+
+    # PGN text of a game : the seven tag roster, the other tags, then the movetext wrapped to LINE_LENGTH.
+    # A game starting with black to move has its first move numbered "n...".
+    headers = dict(SEVEN_TAG_ROSTER)
+    headers.update(game.headers)
+    headers['Result'] = game.result
+    lines = [f'[{tag} "{_escape(value)}"]' for tag, value in headers.items()]
+
+    position = game.start_position()
+    number, black = position.fullmove, position.turn == BLACK
+    tokens = [f'{number}...'] if black and game.moves else []
+    for san in game.moves:
+        if not black:
+            tokens.append(f'{number}.')
+        tokens.append(san)
+        number += black
+        black = not black
+    tokens.append(game.result)
+
+    movetext = ['']
+    for token in tokens:
+        if movetext[-1] and len(movetext[-1]) + 1 + len(token) > LINE_LENGTH:
+            movetext.append('')
+        movetext[-1] = f'{movetext[-1]} {token}' if movetext[-1] else token
+    return '\n'.join(lines) + '\n\n' + '\n'.join(movetext) + '\n'
+
+def read_games(lines):
+    # Lazily yield the games of a PGN stream
+    for text in read_game_texts(lines):
+        yield parse_game(text)
+
+def replay(game:PgnGame, position:Position=None):
+
+    # Yield (position, move) for each move of the game, the move is played on the position right after.
+    # The same Position object is updated along the game : copy what must be kept (to_fen, pack_position).
+    # An illegal or ambiguous SAN move raises a ValueError.
+    if position is None:
+        position = game.start_position()
+    buf = move_buffer()
+    for san in game.moves:
+        n = generate_legal(position, buf)
+        mv = san_to_move(position, san, buf[:n])
+        yield position, mv
+        move(mv, position)
+
+def replay_stream(lines, workers:int=1, executor:Executor=None):
+
+    # Replay every game of a PGN stream and yield (plies, result, error) for each one, in the order of the file.
+    # With several workers the games are parsed and replayed in a process pool, with a bounded number
+    # of games in flight so that the whole file is never held in memory.
+    if workers <= 1 and executor is None:
+        for text in read_game_texts(lines):
+            yield _replay_task(text)
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = []
+        for text in read_game_texts(lines):
+            pending.append(executor.submit(_replay_task, text))
+            if len(pending) >= PENDING_PER_WORKER * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Replay the games of a PGN file and check every move')
+    parser.add_argument('pgn', help="PGN file, '-' for the standard input")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes replaying the games')
+    parser.add_argument('--errors', action='store_true', help='print the games that cannot be replayed')
+    args = parser.parse_args()
+
+    source = sys.stdin if args.pgn == '-' else open(args.pgn, encoding='utf-8', errors='replace')
+    stats = ReplayStats()
+    with source:
+        for index, (plies, result, error) in enumerate(replay_stream(source, args.workers), start=1):
+            stats.add(plies, result, error)
+            if error and args.errors:
+                print(f'game {index}, move {plies + 1} : {error}')
+            if stats.games % 1000 == 0:
+                print(stats, file=sys.stderr)
+    print(stats)
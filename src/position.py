@@ -0,0 +1,741 @@
+import random
+import struct
+from array import array
+
+from bitboard import *
+from psqt import PIECE_SQUARE
+
+#################
+### CONSTANTS ###
+#################
+
+# A move is packed in 16 bits : departure (bits 0-5), arrival (bits 6-11) and flags (bits 12-15)
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EP_CAPTURE = 5
+PROMOTION = 8 # + promoted piece type - NIGHT, + CAPTURE if a piece is taken
+
+NULL_MOVE = 0
+MAX_MOVES = 256
+# Most legal moves of one piece (a queen in the middle of an empty board)
+MAX_PIECE_MOVES = 27
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# Plies of the undo stack allocated at once, it grows by as much when a game gets longer
+STACK_PLIES = 1024
+
+# 12 bitboards, player to move, castling rights, en passant square, halfmove clock, full move number
+PACK_FORMAT = struct.Struct('<12QBBbBH')
+
+###############
+### Classes ###
+###############
+
+class Move:
+
+    # Thin view of a packed move with the attributes and the display of main.Move
+
+    __slots__ = ('packed', 'piece')
+
+    def __init__(self, packed:int, piece:int=NO_PIECE) -> None:
+        self.packed = packed
+        self.piece = piece
+
+    @property
+    def _from(self) -> tuple[int]:
+        return divmod(self.packed & 63, BOARD_SIZE)
+
+    @property
+    def to(self) -> tuple[int]:
+        return divmod((self.packed >> 6) & 63, BOARD_SIZE)
+
+    @property
+    def take(self) -> bool:
+        return is_capture(self.packed)
+
+    @property
+    def upgrade(self) -> bool:
+        return promotion_type(self.packed) != NO_PIECE
+
+    @property
+    def en_passant(self) -> bool:
+        return self.packed >> 12 == EP_CAPTURE
+
+    @property
+    def rook(self) -> bool:
+        return self.packed >> 12 in (KING_CASTLE, QUEEN_CASTLE)
+
+    def __str__(self) -> str:
+        piece = PIECE_SYMBOLS[self.piece] if self.piece != NO_PIECE else '?'
+        tk = 'x' if self.take else ''
+        up = f'({PIECE_SYMBOLS[promotion_type(self.packed)]})' if self.upgrade else ''
+        ro = '(rook)' if self.rook else ''
+        return f'{piece} : {square_name(self.packed & 63)}->{tk}{square_name((self.packed >> 6) & 63)}{up}{ro}'
+
+class Position:
+
+    __slots__ = ('pieces', 'occupancy', 'squares', 'turn', 'castling', 'ep', 'hash', 'score', 'halfmove', 'fullmove',
+                 'ply', 'castling_stack', 'ep_stack', 'hash_stack', 'taken_stack', 'halfmove_stack')
+
+    def __init__(self) -> None:
+
+        self.pieces = [0] * 12
+        self.occupancy = [0, 0, 0]
+        self.squares = [NO_PIECE] * NB_SQUARES
+
+        self.turn = WHITE
+        self.castling = 0
+        self.ep = NO_SQUARE
+        self.hash = 0
+        # Material and piece-square sum seen by white, kept up to date by put_piece/remove_piece
+        self.score = 0
+        # Moves since the last capture or pawn move, and number of the current full move
+        self.halfmove = 0
+        self.fullmove = 1
+
+        # Undo stack indexed by ply : castling rights, en passant square, hash, taken piece and halfmove clock
+        # before each played move. The arrays are allocated once, make/unmake only write and read one slot.
+        self.ply = 0
+        self.castling_stack = array('B', bytes(STACK_PLIES))
+        self.ep_stack = array('b', bytes(STACK_PLIES))
+        self.hash_stack = array('Q', bytes(8 * STACK_PLIES))
+        self.taken_stack = array('b', bytes(STACK_PLIES))
+        self.halfmove_stack = array('H', bytes(2 * STACK_PLIES))
+
+    def copy(self) -> 'Position':
+        # Independent position with the same undo stack, so that the copy still sees the repetitions
+        position = Position.__new__(Position)
+        position.pieces = self.pieces[:]
+        position.occupancy = self.occupancy[:]
+        position.squares = self.squares[:]
+        position.turn, position.castling, position.ep, position.hash = self.turn, self.castling, self.ep, self.hash
+        position.score, position.halfmove, position.fullmove, position.ply = self.score, self.halfmove, self.fullmove, self.ply
+        position.castling_stack = self.castling_stack[:]
+        position.ep_stack = self.ep_stack[:]
+        position.hash_stack = self.hash_stack[:]
+        position.taken_stack = self.taken_stack[:]
+        position.halfmove_stack = self.halfmove_stack[:]
+        return position
+
+    def grow_stack(self) -> None:
+        for stack in (self.castling_stack, self.ep_stack, self.hash_stack, self.taken_stack, self.halfmove_stack):
+            stack.frombytes(bytes(stack.itemsize * STACK_PLIES))
+
+    def put_piece(self, code:int, sq:int) -> None:
+        bit = 1 << sq
+        self.pieces[code] |= bit
+        self.occupancy[code // 6] |= bit
+        self.occupancy[BOTH] |= bit
+        self.squares[sq] = code
+        self.hash ^= ZOBRIST_PIECES[code][sq]
+        self.score += PIECE_SQUARE[code][sq]
+
+    def remove_piece(self, code:int, sq:int) -> None:
+        bit = 1 << sq
+        self.pieces[code] ^= bit
+        self.occupancy[code // 6] ^= bit
+        self.occupancy[BOTH] ^= bit
+        self.squares[sq] = NO_PIECE
+        self.hash ^= ZOBRIST_PIECES[code][sq]
+        self.score -= PIECE_SQUARE[code][sq]
+
+    def king_square(self, color:int) -> int:
+        return lsb_square(self.pieces[color * 6 + KING])
+
+# Castling rights kept after a piece leaves or arrives on a square
+CASTLING_MASK = [15] * NB_SQUARES
+CASTLING_MASK[square_index('e1')] = 15 ^ (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[square_index('h1')] = 15 ^ WHITE_KINGSIDE
+CASTLING_MASK[square_index('a1')] = 15 ^ WHITE_QUEENSIDE
+CASTLING_MASK[square_index('e8')] = 15 ^ (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[square_index('h8')] = 15 ^ BLACK_KINGSIDE
+CASTLING_MASK[square_index('a8')] = 15 ^ BLACK_QUEENSIDE
+
+# Squares of the king and the rook a castling right needs
+CASTLING_SQUARES = {WHITE_KINGSIDE: (WHITE, square_index('e1'), square_index('h1')),
+                    WHITE_QUEENSIDE: (WHITE, square_index('e1'), square_index('a1')),
+                    BLACK_KINGSIDE: (BLACK, square_index('e8'), square_index('h8')),
+                    BLACK_QUEENSIDE: (BLACK, square_index('e8'), square_index('a8'))}
+
+# (right, empty squares, squares that must not be attacked, packed move)
+CASTLINGS = [
+    [(WHITE_KINGSIDE, (1 << 61) | (1 << 62), (1 << 60) | (1 << 61) | (1 << 62), 60 | (62 << 6) | (KING_CASTLE << 12)),
+     (WHITE_QUEENSIDE, (1 << 57) | (1 << 58) | (1 << 59), (1 << 60) | (1 << 59) | (1 << 58), 60 | (58 << 6) | (QUEEN_CASTLE << 12))],
+    [(BLACK_KINGSIDE, (1 << 5) | (1 << 6), (1 << 4) | (1 << 5) | (1 << 6), 4 | (6 << 6) | (KING_CASTLE << 12)),
+     (BLACK_QUEENSIDE, (1 << 1) | (1 << 2) | (1 << 3), (1 << 4) | (1 << 3) | (1 << 2), 4 | (2 << 6) | (QUEEN_CASTLE << 12))]
+]
+
+CASTLING_SYMBOLS = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+
+PROMOTIONS = (QUEEN, ROOK, BISHOP, NIGHT)
+
+# Zobrist keys, the seed is fixed so that hashes are the same from one run to another
+_random = random.Random(2023)
+ZOBRIST_PIECES = [[_random.getrandbits(64) for _ in range(NB_SQUARES)] for _ in range(12)]
+ZOBRIST_TURN = _random.getrandbits(64)
+ZOBRIST_CASTLING = [_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP = [_random.getrandbits(64) for _ in range(BOARD_SIZE)]
+
+SCORE_PER_PIECE = [1, 3, 3, 5, 9, 20]
+
+#################
+### Functions ###
+#################
+
+###########################
+###### Sub functions ######
+###########################
+
+def encode_move(_from:int, to:int, flags:int=QUIET) -> int:
+    return _from | (to << 6) | (flags << 12)
+
+def move_from(mv:int) -> int:
+    return mv & 63
+
+def move_to(mv:int) -> int:
+    return (mv >> 6) & 63
+
+def move_flags(mv:int) -> int:
+    return mv >> 12
+
+def is_capture(mv:int) -> bool:
+    return (mv >> 12) & CAPTURE != 0
+
+def promotion_type(mv:int) -> int:
+    return NIGHT + ((mv >> 12) & 3) if mv >> 12 & PROMOTION else NO_PIECE
+
+def move_name(mv:int) -> str:
+    # Coordinate notation, e.g. e2e4 or e7e8q
+    up = PIECE_SYMBOLS[6 + promotion_type(mv)] if mv >> 12 & PROMOTION else ''
+    return f'{square_name(mv & 63)}{square_name((mv >> 6) & 63)}{up}'
+
+def move_buffer() -> array:
+    # Preallocated list of packed moves, filled by the generators from a given index
+    return array('H', bytes(2 * MAX_MOVES))
+
+_LEGACY_TYPES = {'p': PAWN, 'n': NIGHT, 'b': BISHOP, 'r': ROOK, 'q': QUEEN, 'k': KING}
+
+def from_board(piece_dict:dict, board, turn:str) -> Position:
+
+    # Build a bitboard position from the piece_dict/board of main.py
+    position = Position()
+    position.turn = WHITE if turn == 'w' else BLACK
+
+    for i in range(BOARD_SIZE):
+        for j in range(BOARD_SIZE):
+            key = board[i,j]
+            if key:
+                piece = piece_dict[key]
+                color = WHITE if piece._color == 'w' else BLACK
+                position.put_piece(piece_code(color, _LEGACY_TYPES[piece._id]), i * 8 + j)
+                # Only a pawn of the player who just moved, pushed two squares on its first move, can be taken en passant
+                if piece._id == 'p' and color != position.turn and len(piece.moves) == 1 and abs(piece.moves[0]._from[0] - i) == 2:
+                    position.ep = (i * 8 + j) + (8 if color == WHITE else -8)
+
+    for color, king_sq, rooks in ((WHITE, 60, ((WHITE_KINGSIDE, 63), (WHITE_QUEENSIDE, 56))),
+                                  (BLACK, 4, ((BLACK_KINGSIDE, 7), (BLACK_QUEENSIDE, 0)))):
+        king_key = board[king_sq >> 3, king_sq & 7]
+        if not king_key or not piece_dict[king_key].not_moved or position.squares[king_sq] != piece_code(color, KING):
+            continue
+        for right, rook_sq in rooks:
+            rook_key = board[rook_sq >> 3, rook_sq & 7]
+            if rook_key and piece_dict[rook_key].not_moved and position.squares[rook_sq] == piece_code(color, ROOK):
+                position.castling |= right
+
+    position.hash = compute_hash(position)
+    return position
+
+def from_fen(fen:str) -> Position:
+
+    # Placement, player to move, castling rights, en passant square and move counters of a FEN string.
+    # The counters may be missing (EPD lines), a malformed string raises a ValueError.
+    fields = fen.split()
+    if not 4 <= len(fields) <= 6:
+        raise ValueError(f'FEN must have 4 to 6 fields : {fen!r}')
+
+    rows = fields[0].split('/')
+    if len(rows) != BOARD_SIZE:
+        raise ValueError(f'FEN placement must have 8 rows : {fields[0]!r}')
+
+    position = Position()
+    for i, row in enumerate(rows):
+        j = 0
+        for char in row:
+            if char.isdigit():
+                j += int(char)
+            elif char in PIECE_SYMBOLS and j < BOARD_SIZE:
+                position.put_piece(PIECE_SYMBOLS.index(char), i * 8 + j)
+                j += 1
+            else:
+                raise ValueError(f'Bad FEN row : {row!r}')
+        if j != BOARD_SIZE:
+            raise ValueError(f'FEN row must have 8 squares : {row!r}')
+    if popcount(position.pieces[KING]) != 1 or popcount(position.pieces[6 + KING]) != 1:
+        raise ValueError(f'FEN must have one king of each color : {fields[0]!r}')
+    if (position.pieces[PAWN] | position.pieces[6 + PAWN]) & (RANK_1 | RANK_8):
+        raise ValueError(f'FEN must not have pawns on the first or last rank : {fields[0]!r}')
+
+    if fields[1] not in ('w', 'b'):
+        raise ValueError(f'Bad FEN player to move : {fields[1]!r}')
+    position.turn = WHITE if fields[1] == 'w' else BLACK
+    if is_check(position, position.turn ^ 1):
+        raise ValueError(f'FEN player not to move must not be in check : {fen!r}')
+
+    if fields[2] != '-':
+        for char in fields[2]:
+            if char not in CASTLING_SYMBOLS:
+                raise ValueError(f'Bad FEN castling rights : {fields[2]!r}')
+            position.castling |= CASTLING_SYMBOLS[char]
+    # A right is dropped when its king or rook is not on its starting square
+    for right, (color, king_sq, rook_sq) in CASTLING_SQUARES.items():
+        if position.squares[king_sq] != color * 6 + KING or position.squares[rook_sq] != color * 6 + ROOK:
+            position.castling &= 15 ^ right
+
+    if fields[3] != '-':
+        if len(fields[3]) != 2 or fields[3][0] not in 'abcdefgh' or fields[3][1] != ('6' if position.turn == WHITE else '3'):
+            raise ValueError(f'Bad FEN en passant square : {fields[3]!r}')
+        # The square is kept only behind a pawn that has just been pushed two squares
+        ep = square_index(fields[3])
+        pushed = ep + 8 if position.turn == WHITE else ep - 8
+        if (position.squares[pushed] == (position.turn ^ 1) * 6 + PAWN and position.squares[ep] == NO_PIECE
+                and position.squares[2 * ep - pushed] == NO_PIECE):
+            position.ep = ep
+
+    try:
+        position.halfmove = int(fields[4]) if len(fields) > 4 else 0
+        position.fullmove = int(fields[5]) if len(fields) > 5 else 1
+    except ValueError:
+        raise ValueError(f'Bad FEN move counters : {" ".join(fields[4:])!r}') from None
+    if position.halfmove < 0 or position.fullmove < 1:
+        raise ValueError(f'Bad FEN move counters : {" ".join(fields[4:])!r}')
+
+    position.hash = compute_hash(position)
+    return position
+
+def to_fen(position:Position, counters:bool=True) -> str:
+
+    # FEN string of a position, without the move counters it is the position part of an EPD line
+    rows = []
+    for i in range(BOARD_SIZE):
+        row, empty = '', 0
+        for code in position.squares[i * 8:i * 8 + 8]:
+            if code == NO_PIECE:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            row += PIECE_SYMBOLS[code]
+        rows.append(row + str(empty) if empty else row)
+
+    castling = ''.join(char for char, right in CASTLING_SYMBOLS.items() if position.castling & right) or '-'
+    ep = square_name(position.ep) if position.ep != NO_SQUARE else '-'
+    fen = f'{"/".join(rows)} {"w" if position.turn == WHITE else "b"} {castling} {ep}'
+    return f'{fen} {position.halfmove} {position.fullmove}' if counters else fen
+
+def pack_position(position:Position) -> bytes:
+    # Compact form of a position (102 bytes) to send it to another process, the undo stack is not kept
+    return PACK_FORMAT.pack(*position.pieces, position.turn, position.castling, position.ep,
+                            min(position.halfmove, 255), position.fullmove)
+
+def unpack_position(data:bytes) -> Position:
+
+    fields = PACK_FORMAT.unpack(data)
+    position = Position()
+    for code, bb in enumerate(fields[:12]):
+        for sq in squares_of(bb):
+            position.put_piece(code, sq)
+    position.turn, position.castling, position.ep, position.halfmove, position.fullmove = fields[12:]
+    position.hash = compute_hash(position)
+    return position
+
+def compute_hash(position:Position) -> int:
+
+    # Hash of the position computed from scratch, move() and undo_move() keep it up to date
+    key = 0
+    for sq, code in enumerate(position.squares):
+        if code != NO_PIECE:
+            key ^= ZOBRIST_PIECES[code][sq]
+    if position.turn == BLACK:
+        key ^= ZOBRIST_TURN
+    key ^= ZOBRIST_CASTLING[position.castling]
+    if position.ep != NO_SQUARE:
+        key ^= ZOBRIST_EP[position.ep & 7]
+    return key
+
+def attackers_to(position:Position, sq:int, by_color:int, occ:int) -> int:
+
+    # Look outward from the square for each kind of attacker
+    pieces = position.pieces
+    offset = by_color * 6
+    queens = pieces[offset + QUEEN]
+    return ((PAWN_ATTACKS[by_color ^ 1][sq] & pieces[offset + PAWN])
+          | (KNIGHT_ATTACKS[sq] & pieces[offset + NIGHT])
+          | (KING_ATTACKS[sq] & pieces[offset + KING])
+          | (bishop_attacks(sq, occ) & (pieces[offset + BISHOP] | queens))
+          | (rook_attacks(sq, occ) & (pieces[offset + ROOK] | queens)))
+
+def is_square_attacked(position:Position, sq:int, by_color:int) -> bool:
+    return attackers_to(position, sq, by_color, position.occupancy[BOTH]) != 0
+
+def attacked_squares(position:Position, color:int, occ:int) -> int:
+
+    # Every square attacked by the pieces of one color
+    pieces = position.pieces
+    offset = color * 6
+    attacks = pawn_attacks(pieces[offset + PAWN], color) | knight_attacks(pieces[offset + NIGHT]) | king_attacks(pieces[offset + KING])
+    queens = pieces[offset + QUEEN]
+    for sq in squares_of(pieces[offset + BISHOP] | queens):
+        attacks |= bishop_attacks(sq, occ)
+    for sq in squares_of(pieces[offset + ROOK] | queens):
+        attacks |= rook_attacks(sq, occ)
+    return attacks
+
+def pins(position:Position, color:int, king_sq:int) -> dict[int,int]:
+
+    # Pinned piece square -> squares it can still move to (the ray up to and including the pinner)
+    pieces = position.pieces
+    offset = (color ^ 1) * 6
+    enemy = position.occupancy[color ^ 1]
+    occ = position.occupancy[BOTH]
+    queens = pieces[offset + QUEEN]
+    snipers = ((rook_attacks(king_sq, enemy) & (pieces[offset + ROOK] | queens))
+             | (bishop_attacks(king_sq, enemy) & (pieces[offset + BISHOP] | queens)))
+
+    pin_rays = {}
+    for sq in squares_of(snipers):
+        ray = BETWEEN[king_sq][sq]
+        blockers = ray & occ
+        if blockers and not blockers & (blockers - 1) and blockers & position.occupancy[color]:
+            pin_rays[lsb_square(blockers)] = ray | (1 << sq)
+    return pin_rays
+
+def _ep_is_legal(position:Position, mv:int) -> bool:
+    # Taking en passant removes two pieces from the same rank, simply play it to see
+    color = position.turn
+    move(mv, position)
+    legal = not is_check(position, color)
+    undo_move(mv, position)
+    return legal
+
+# With quiets=False the helpers only write captures and promotions (quiescence search), with captures=False
+# only the other moves (staged generation). from_mask keeps the moves of the pieces standing on it.
+
+def _pawn_moves(position:Position, color:int, buf:array, n:int, check_mask:int=FULL, pin_rays:dict=None, quiets:bool=True, captures:bool=True, from_mask:int=FULL) -> int:
+
+    occ = position.occupancy[BOTH]
+    enemy = position.occupancy[color ^ 1] if captures else 0
+    ep = position.ep
+    ep_bit = 1 << ep if ep != NO_SQUARE and captures else 0
+    step = 8 if color == WHITE else -8
+    start_rank = RANK_8 << (48 if color == WHITE else 8)
+    last_rank = RANK_8 if color == WHITE else RANK_1
+
+    for _from in squares_of(position.pieces[color * 6 + PAWN] & from_mask):
+        mask = check_mask
+        if pin_rays and _from in pin_rays:
+            mask &= pin_rays[_from]
+
+        to = _from - step
+        if not occ & (1 << to):
+            if mask & (1 << to):
+                if (1 << to) & last_rank:
+                    if captures:
+                        for up in PROMOTIONS:
+                            buf[n] = _from | (to << 6) | ((PROMOTION + up - NIGHT) << 12); n += 1
+                elif quiets:
+                    buf[n] = _from | (to << 6); n += 1
+            to -= step
+            if quiets and (1 << _from) & start_rank and not occ & (1 << to) and mask & (1 << to):
+                buf[n] = _from | (to << 6) | (DOUBLE_PUSH << 12); n += 1
+
+        attacks = PAWN_ATTACKS[color][_from]
+        for to in squares_of(attacks & enemy & mask):
+            if (1 << to) & last_rank:
+                for up in PROMOTIONS:
+                    buf[n] = _from | (to << 6) | ((PROMOTION + CAPTURE + up - NIGHT) << 12); n += 1
+            else:
+                buf[n] = _from | (to << 6) | (CAPTURE << 12); n += 1
+
+        if attacks & ep_bit:
+            mv = _from | (ep << 6) | (EP_CAPTURE << 12)
+            if pin_rays is None or _ep_is_legal(position, mv):
+                buf[n] = mv; n += 1
+
+    return n
+
+def _piece_moves(position:Position, color:int, buf:array, n:int, check_mask:int=FULL, pin_rays:dict=None, quiets:bool=True, captures:bool=True, from_mask:int=FULL) -> int:
+
+    occ = position.occupancy[BOTH]
+    enemy = position.occupancy[color ^ 1]
+    not_own = (FULL ^ position.occupancy[color]) & check_mask
+    offset = color * 6
+
+    for piece_type in (NIGHT, BISHOP, ROOK, QUEEN):
+        for _from in squares_of(position.pieces[offset + piece_type] & from_mask):
+            if piece_type == NIGHT:
+                targets = KNIGHT_ATTACKS[_from]
+            elif piece_type == BISHOP:
+                targets = bishop_attacks(_from, occ)
+            elif piece_type == ROOK:
+                targets = rook_attacks(_from, occ)
+            else:
+                targets = queen_attacks(_from, occ)
+            targets &= not_own
+            if pin_rays and _from in pin_rays:
+                targets &= pin_rays[_from]
+            if captures:
+                for to in squares_of(targets & enemy):
+                    buf[n] = _from | (to << 6) | (CAPTURE << 12); n += 1
+            if quiets:
+                for to in squares_of(targets & ~enemy):
+                    buf[n] = _from | (to << 6); n += 1
+
+    return n
+
+def _king_moves(position:Position, color:int, buf:array, n:int, attacked:int=0, quiets:bool=True, captures:bool=True, from_mask:int=FULL) -> int:
+
+    enemy = position.occupancy[color ^ 1]
+    for _from in squares_of(position.pieces[color * 6 + KING] & from_mask):
+        targets = KING_ATTACKS[_from] & ~position.occupancy[color] & ~attacked & FULL
+        if captures:
+            for to in squares_of(targets & enemy):
+                buf[n] = _from | (to << 6) | (CAPTURE << 12); n += 1
+        if quiets:
+            for to in squares_of(targets & ~enemy):
+                buf[n] = _from | (to << 6); n += 1
+    return n
+
+def _castling_moves(position:Position, color:int, buf:array, n:int, attacked:int=None) -> int:
+
+    occ = position.occupancy[BOTH]
+    for right, empty, safe, mv in CASTLINGS[color]:
+        if position.castling & right and not occ & empty:
+            if attacked is None:
+                if any(is_square_attacked(position, sq, color ^ 1) for sq in squares_of(safe)):
+                    continue
+            elif attacked & safe:
+                continue
+            buf[n] = mv; n += 1
+    return n
+
+############################
+###### Main functions ######
+############################
+
+def generate_pseudo(position:Position, color:int, buf:array, n:int=0) -> int:
+
+    # Pseudo-legal moves of one color written in buf from index n, castling through check already excluded.
+    # Return the index after the last move.
+    n = _pawn_moves(position, color, buf, n)
+    n = _piece_moves(position, color, buf, n)
+    n = _king_moves(position, color, buf, n)
+    return _castling_moves(position, color, buf, n)
+
+def legal_context(position:Position) -> tuple[int,int,int,dict]:
+
+    # (checkers, squares attacked by the opponent, check mask, pin rays) of the player to move :
+    # computed once per position and shared by the generation stages
+    us = position.turn
+    them = us ^ 1
+    king_sq = position.king_square(us)
+    occ = position.occupancy[BOTH]
+
+    checkers = attackers_to(position, king_sq, them, occ)
+    # The king is removed so that it cannot step back along the ray of a slider
+    attacked = attacked_squares(position, them, occ ^ (1 << king_sq))
+    check_mask = checkers | BETWEEN[king_sq][lsb_square(checkers)] if checkers else FULL
+    return checkers, attacked, check_mask, pins(position, us, king_sq)
+
+def generate_legal(position:Position, buf:array, n:int=0, quiets:bool=True, captures:bool=True, context:tuple=None, from_mask:int=FULL) -> int:
+
+    # Only legal moves are written in buf, from the checkers, pins and attacked squares of the context.
+    # Without quiets only the captures and promotions are written, without captures only the other moves.
+    us = position.turn
+    checkers, attacked, check_mask, pin_rays = context or legal_context(position)
+
+    n = _king_moves(position, us, buf, n, attacked, quiets, captures, from_mask)
+    if checkers & (checkers - 1):
+        return n # double check, only the king can move
+
+    n = _pawn_moves(position, us, buf, n, check_mask, pin_rays, quiets, captures, from_mask)
+    n = _piece_moves(position, us, buf, n, check_mask, pin_rays, quiets, captures, from_mask)
+    if quiets and not checkers and from_mask & position.pieces[us * 6 + KING]:
+        n = _castling_moves(position, us, buf, n, attacked)
+    return n
+
+def generate_captures(position:Position, buf:array, n:int=0, context:tuple=None) -> int:
+    # Legal captures and promotions only, the quiet moves are never generated
+    return generate_legal(position, buf, n, quiets=False, context=context)
+
+def generate_quiets(position:Position, buf:array, n:int=0, context:tuple=None) -> int:
+    # The other legal moves : quiet moves, double pushes and castlings
+    return generate_legal(position, buf, n, captures=False, context=context)
+
+def is_legal_move(position:Position, mv:int, context:tuple=None) -> bool:
+    # A move coming from elsewhere (transposition table, killer) is checked with the moves of its piece only
+    code = position.squares[mv & 63]
+    if mv == NULL_MOVE or code == NO_PIECE or code // 6 != position.turn:
+        return False
+    buf = array('H', bytes(2 * MAX_PIECE_MOVES))
+    n = generate_legal(position, buf, context=context, from_mask=1 << (mv & 63))
+    return mv in buf[:n]
+
+def has_legal_move(position:Position, context:tuple=None) -> bool:
+
+    # Checkmate / stalemate test : stop at the first group of pieces with a legal move,
+    # the king first since its moves are the cheapest ones (a legal castling implies a legal king step)
+    us = position.turn
+    checkers, attacked, check_mask, pin_rays = context or legal_context(position)
+    buf = array('H', bytes(2 * MAX_MOVES))
+    if _king_moves(position, us, buf, 0, attacked):
+        return True
+    if checkers & (checkers - 1):
+        return False
+    return bool(_piece_moves(position, us, buf, 0, check_mask, pin_rays) or _pawn_moves(position, us, buf, 0, check_mask, pin_rays))
+
+def generate_moves(position:Position, color:int) -> list[int]:
+    buf = move_buffer()
+    return buf[:generate_pseudo(position, color, buf)].tolist()
+
+def legal_moves(position:Position) -> list[int]:
+    buf = move_buffer()
+    return buf[:generate_legal(position, buf)].tolist()
+
+def possible_moves(position:Position, turn:int) -> tuple[list[int],list[int]]:
+
+    # Same contract as main.possible_moves : moves of the player, then moves of the ennemy
+    return generate_moves(position, turn), generate_moves(position, turn ^ 1)
+
+def is_check(position:Position, color:int) -> bool:
+    # Return if the king of the given color is attacked
+    return attackers_to(position, position.king_square(color), color ^ 1, position.occupancy[BOTH]) != 0
+
+def is_check_mate(position:Position) -> bool:
+    # Return if the player to move is in checkmate state
+    return is_check(position, position.turn) and not has_legal_move(position)
+
+def move(mv:int, position:Position) -> None:
+
+    _from = mv & 63
+    to = (mv >> 6) & 63
+    flags = mv >> 12
+    squares = position.squares
+    code = squares[_from]
+    color = position.turn
+
+    ply = position.ply
+    if ply == len(position.hash_stack):
+        position.grow_stack()
+    position.castling_stack[ply] = position.castling
+    position.ep_stack[ply] = position.ep
+    position.hash_stack[ply] = position.hash
+    position.halfmove_stack[ply] = position.halfmove
+    position.ply = ply + 1
+
+    taken = NO_PIECE
+    if flags & CAPTURE:
+        taken_sq = to + (8 if color == WHITE else -8) if flags == EP_CAPTURE else to
+        taken = squares[taken_sq]
+        position.remove_piece(taken, taken_sq)
+    position.taken_stack[ply] = taken
+
+    position.remove_piece(code, _from)
+    if flags & PROMOTION:
+        position.put_piece(color * 6 + NIGHT + (flags & 3), to)
+    else:
+        position.put_piece(code, to)
+
+    if flags == KING_CASTLE:
+        position.remove_piece(color * 6 + ROOK, _from + 3)
+        position.put_piece(color * 6 + ROOK, _from + 1)
+    elif flags == QUEEN_CASTLE:
+        position.remove_piece(color * 6 + ROOK, _from - 4)
+        position.put_piece(color * 6 + ROOK, _from - 1)
+
+    position.hash ^= ZOBRIST_CASTLING[position.castling]
+    position.castling &= CASTLING_MASK[_from] & CASTLING_MASK[to]
+    position.hash ^= ZOBRIST_CASTLING[position.castling]
+
+    if position.ep != NO_SQUARE:
+        position.hash ^= ZOBRIST_EP[position.ep & 7]
+    if flags == DOUBLE_PUSH:
+        position.ep = (_from + to) >> 1
+        position.hash ^= ZOBRIST_EP[position.ep & 7]
+    else:
+        position.ep = NO_SQUARE
+
+    position.halfmove = 0 if taken != NO_PIECE or code % 6 == PAWN else position.halfmove + 1
+    position.fullmove += color
+    position.turn = color ^ 1
+    position.hash ^= ZOBRIST_TURN
+
+def undo_move(mv:int, position:Position) -> None:
+
+    _from = mv & 63
+    to = (mv >> 6) & 63
+    flags = mv >> 12
+    color = position.turn ^ 1
+
+    ply = position.ply = position.ply - 1
+    position.castling = position.castling_stack[ply]
+    position.ep = position.ep_stack[ply]
+    position.halfmove = position.halfmove_stack[ply]
+    taken = position.taken_stack[ply]
+    position.fullmove -= color
+
+    if flags == KING_CASTLE:
+        position.remove_piece(color * 6 + ROOK, _from + 1)
+        position.put_piece(color * 6 + ROOK, _from + 3)
+    elif flags == QUEEN_CASTLE:
+        position.remove_piece(color * 6 + ROOK, _from - 1)
+        position.put_piece(color * 6 + ROOK, _from - 4)
+
+    code = position.squares[to]
+    position.remove_piece(code, to)
+    position.put_piece(color * 6 + PAWN if flags & PROMOTION else code, _from)
+
+    if taken != NO_PIECE:
+        position.put_piece(taken, to + (8 if color == WHITE else -8) if flags == EP_CAPTURE else to)
+
+    position.turn = color
+    position.hash = position.hash_stack[ply]
+
+def is_repetition(position:Position, count:int=1) -> bool:
+
+    # The position was already reached `count` times with the same player to move. Only the plies since
+    # the last capture or pawn move are looked at (every other ply, the player to move must be the same).
+    key = position.hash
+    hashes = position.hash_stack
+    found = 0
+    for ply in range(position.ply - 4, max(position.ply - position.halfmove, 0) - 1, -2):
+        if hashes[ply] == key:
+            found += 1
+            if found == count:
+                return True
+    return False
+
+def is_fifty_moves(position:Position) -> bool:
+    return position.halfmove >= 100
+
+##################################
+###### Evaluation functions ######
+##################################
+
+def get_score_from_board(position:Position, psb_mv:list[int], hd_mv:list[int], turn:int) -> int:
+
+    score = 0
+    pieces = position.pieces
+    for piece_type in range(6):
+        score += SCORE_PER_PIECE[piece_type] * 10 * (pieces[piece_type].bit_count() - pieces[6 + piece_type].bit_count())
+
+    if turn == WHITE:
+        score = score + len(psb_mv) - len(hd_mv)
+    else:
+        score = score - len(psb_mv) + len(hd_mv)
+
+    return score
@@ -0,0 +1,313 @@
+import time
+
+from book import OpeningBook
+from evaluation import *
+from ordering import MoveOrdering
+from tablebase import Tablebase
+from transposition import *
+
+#################
+### CONSTANTS ###
+#################
+
+MATE_SCORE = 100000
+INFINITE = 1000000
+MAX_DEPTH = 64
+# Tablebase wins are below mate scores, minus the number of plies to mate so that the shortest mate is preferred
+TB_WIN = MATE_SCORE // 2
+# Lowest score of a tablebase win : the distance to mate and the ply stay far below the margin
+TB_BOUND = TB_WIN - 1000
+
+# The budget is only looked at every CHECK_EVERY nodes
+CHECK_EVERY = 1024
+
+# Quiescence search : a capture is skipped when even winning the piece with this margin cannot raise alpha
+DELTA_MARGIN = 200
+
+###############
+### Classes ###
+###############
+
+class Search:
+
+    def __init__(self, position:Position, max_depth:int=MAX_DEPTH, max_nodes:int=None, max_time:float=None, tt:TranspositionTable=None, with_mobility:bool=False, root_moves:list[int]=None, tablebase:Tablebase=None, ordering:MoveOrdering=None) -> None:
+
+        self.position = position
+        # Endgame tables probed below the root once few pieces are left
+        self.tablebase = tablebase
+        self.with_mobility = with_mobility
+        # Only these moves are searched at the root when given (to split the root between processes)
+        self.root_moves = root_moves
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        # No new iteration is started past this time (the iteration would rarely finish before max_time)
+        self.soft_time:float = None
+        # Called with the search after each completed iteration (to print the progress)
+        self.on_iteration = None
+
+        self.nodes = 0
+        # Statistics of the last run : nodes of the quiescence search, cutoffs by the table and by a move
+        # (first_cutoffs : the cutoff came from the first move searched, a measure of the move ordering)
+        self.qnodes = 0
+        self.tt_cutoffs = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.depth = 0
+        self.score = 0
+        self.stopped = False
+        self.interrupted = False
+        self.start = 0.
+
+        # Triangular table, pv[ply] is the principal variation starting at ply
+        self.pv:list[list[int]] = [[] for _ in range(MAX_DEPTH + 1)]
+        self.best_pv:list[int] = []
+        self.buffers = [move_buffer() for _ in range(MAX_DEPTH + 1)]
+        # Kept by the caller from one search to the next like the table, so that the history carries over
+        self.ordering = ordering if ordering is not None else MoveOrdering(MAX_DEPTH)
+
+    def run(self) -> tuple[int,int]:
+
+        self.start = time.perf_counter()
+        self.nodes = self.qnodes = self.tt_cutoffs = self.cutoffs = self.first_cutoffs = 0
+        self.depth = self.score = 0
+        self.best_pv = []
+        self.stopped = False
+        self.tt.new_search()
+        self.ordering.new_search()
+        try:
+            return self._iterate()
+        finally:
+            # A stop request ends the run it interrupted. It is cleared here rather than at the start,
+            # where a stop sent just before the search thread reaches run() would be lost.
+            self.interrupted = False
+
+    def _iterate(self) -> tuple[int,int]:
+
+        best_move, best_score = NULL_MOVE, 0
+        for depth in range(1, self.max_depth + 1):
+            score = self._negamax(depth, 0, -INFINITE, INFINITE, True)
+            # An interrupted iteration is not trusted, keep the previous one
+            if self.stopped:
+                break
+            self.depth = depth
+            self.best_pv = list(self.pv[0])
+            best_score = score
+            best_move = self.best_pv[0] if self.best_pv else NULL_MOVE
+            self.score = score
+            if self.on_iteration is not None:
+                self.on_iteration(self)
+            if best_move == NULL_MOVE or abs(score) >= MATE_SCORE - MAX_DEPTH:
+                break
+            if self.soft_time is not None and time.perf_counter() - self.start >= self.soft_time:
+                break
+
+        return best_move, best_score
+
+    def stop(self) -> None:
+        # Can be called from another thread, the search stops at its next budget check
+        self.interrupted = True
+
+    def _out_of_budget(self) -> bool:
+        if self.depth == 0:
+            return False # depth 1 is always completed to have a move to play
+        if self.interrupted:
+            return True
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            return True
+        if self.max_time is not None and time.perf_counter() - self.start >= self.max_time:
+            return True
+        return False
+
+    def _moves(self, ply:int, tt_move:int, on_pv:bool):
+
+        # While the line follows the previous principal variation its move is searched first, elsewhere the
+        # stored best move of the position. Below the root the moves are generated by stages, so a cutoff
+        # spares the generation of the others.
+        first = self.best_pv[ply] if on_pv and ply < len(self.best_pv) else tt_move
+        buf = self.buffers[ply]
+        if ply or self.root_moves is None:
+            return self.ordering.staged_moves(self.position, buf, ply, first)
+        return self._split_root_moves(buf, first)
+
+    def _split_root_moves(self, buf, first:int):
+        # Only the given root moves are searched (to split the root between processes)
+        kept = [mv for mv in legal_moves(self.position) if mv in self.root_moves]
+        for index, mv in enumerate(kept):
+            buf[index] = mv
+        n = len(kept)
+        self.ordering.score_moves(self.position, buf, n, 0, first)
+        for index in range(n):
+            yield self.ordering.pick(buf, n, 0, index)
+
+    def _tablebase_score(self, ply:int) -> int:
+        # Score of the position if it is in the endgame tables, else None.
+        # Like the mate scores, a win is worth less the further it is from the root.
+        if self.tablebase is None or popcount(self.position.occupancy[BOTH]) > self.tablebase.max_pieces:
+            return None
+        found = self.tablebase.probe(self.position)
+        if found is None:
+            return None
+        wdl, plies = found
+        return wdl * (TB_WIN - plies - ply)
+
+    def _quiescence(self, ply:int, alpha:int, beta:int) -> int:
+
+        # Only captures and promotions are searched, the player to move can also stop (stand pat)
+        # unless in check, where every evasion is searched
+        self.nodes += 1
+        self.qnodes += 1
+        self.pv[ply] = []
+        if self.nodes % CHECK_EVERY == 0 and self._out_of_budget():
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        score = self._tablebase_score(ply)
+        if score is not None:
+            return score
+        position = self.position
+        if ply == MAX_DEPTH:
+            return evaluate(position, self.with_mobility)
+
+        buf = self.buffers[ply]
+        in_check = is_check(position, position.turn)
+        if in_check:
+            n = generate_legal(position, buf)
+            if not n:
+                return -MATE_SCORE + ply
+            stand_pat = -INFINITE
+        else:
+            stand_pat = evaluate(position, self.with_mobility)
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            n = generate_captures(position, buf)
+
+        self.ordering.score_moves(position, buf, n, ply, NULL_MOVE)
+        squares = position.squares
+        for index in range(n):
+            mv = self.ordering.pick(buf, n, ply, index)
+            if not in_check:
+                flags = mv >> 12
+                # Delta pruning, then captures losing material
+                gain = SEE_VALUES[PAWN if flags == EP_CAPTURE else squares[(mv >> 6) & 63] % 6] if flags & CAPTURE else 0
+                if flags & PROMOTION:
+                    gain += SEE_VALUES[NIGHT + (flags & 3)] - SEE_VALUES[PAWN]
+                if stand_pat + gain + DELTA_MARGIN <= alpha:
+                    continue
+                if flags & CAPTURE and see(position, mv) < 0:
+                    continue
+
+            move(mv, position)
+            score = -self._quiescence(ply + 1, -beta, -alpha)
+            undo_move(mv, position)
+
+            if self.stopped:
+                return 0
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def _negamax(self, depth:int, ply:int, alpha:int, beta:int, on_pv:bool=False) -> int:
+
+        # The leaves are searched until the position is quiet
+        if depth == 0:
+            return self._quiescence(ply, alpha, beta)
+
+        self.nodes += 1
+        self.pv[ply] = []
+        if self.nodes % CHECK_EVERY == 0 and self._out_of_budget():
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        if ply:
+            # A repeated position is a draw : the side that repeats it could repeat it again
+            if is_repetition(self.position) or is_fifty_moves(self.position):
+                return 0
+            score = self._tablebase_score(ply)
+            if score is not None:
+                return score
+
+        if ply == MAX_DEPTH:
+            return evaluate(self.position, self.with_mobility)
+
+        position = self.position
+        alpha_orig = alpha
+        best_mv = NULL_MOVE
+
+        tt_move = NULL_MOVE
+        entry = self.tt.probe(position.hash)
+        if entry is not None:
+            _, tt_depth, bound, tt_score, tt_move, _ = entry
+            if ply and tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if bound == EXACT or (bound == LOWER and tt_score >= beta) or (bound == UPPER and tt_score <= alpha):
+                    self.tt_cutoffs += 1
+                    return tt_score
+
+        searched = 0
+        for mv in self._moves(ply, tt_move, on_pv):
+            move(mv, position)
+            # The line keeps following the previous principal variation only through its move
+            child_on_pv = on_pv and ply < len(self.best_pv) and mv == self.best_pv[ply]
+            score = -self._negamax(depth - 1, ply + 1, -beta, -alpha, child_on_pv)
+            undo_move(mv, position)
+            searched += 1
+
+            if self.stopped:
+                return 0
+            if score > alpha:
+                alpha = score
+                best_mv = mv
+                self.pv[ply] = [mv] + self.pv[ply + 1]
+                if alpha >= beta:
+                    self.ordering.update(position, mv, depth, ply)
+                    self.cutoffs += 1
+                    self.first_cutoffs += searched == 1
+                    break
+
+        if not searched:
+            # Checkmate is worse the sooner it happens, stalemate is a draw
+            return -MATE_SCORE + ply if is_check(position, position.turn) else 0
+
+        bound = LOWER if alpha >= beta else (EXACT if alpha > alpha_orig else UPPER)
+        self.tt.store(position.hash, depth, bound, score_to_tt(alpha, ply), best_mv)
+        return alpha
+
+#################
+### Functions ###
+#################
+
+# Mate and tablebase scores are stored relative to the node, not to the root
+
+def score_to_tt(score:int, ply:int) -> int:
+    if score >= TB_BOUND:
+        return score + ply
+    if score <= -TB_BOUND:
+        return score - ply
+    return score
+
+def score_from_tt(score:int, ply:int) -> int:
+    if score >= TB_BOUND:
+        return score - ply
+    if score <= -TB_BOUND:
+        return score + ply
+    return score
+
+def search(position:Position, max_depth:int=MAX_DEPTH, max_nodes:int=None, max_time:float=None, tt:TranspositionTable=None, tablebase:Tablebase=None) -> tuple[int,int]:
+    return Search(position, max_depth, max_nodes, max_time, tt, tablebase=tablebase).run()
+
+def best_move(piece_dict:dict, board, turn:str, max_depth:int=MAX_DEPTH, max_nodes:int=None, max_time:float=None, book:OpeningBook=None, tablebase:Tablebase=None) -> tuple[int,int]:
+    # Search the position of main.py, the score is given for the player to move.
+    # A book move is played without searching, with the static evaluation as score.
+    position = from_board(piece_dict, board, turn)
+    if book is not None:
+        mv = book.choose(position)
+        if mv != NULL_MOVE:
+            return mv, evaluate(position)
+    return search(position, max_depth, max_nodes, max_time, tablebase=tablebase)
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from game import *
+from search import *
+
+#################
+### CONSTANTS ###
+#################
+
+DEFAULT_PORT = 8765
+DEFAULT_DEPTH = 3
+
+# Latencies kept for the percentiles of the whole server
+LATENCY_WINDOW = 10000
+
+# Commands of the line protocol, every reply starts with the game id when it is about a game :
+#   new [fen]           -> game <id> <fen>
+#   move <id> <move>    -> played <id> <san>, then the engine answers with bestmove
+#   go <id>             -> bestmove <id> <move> <san> <latency ms>
+#   fen <id>            -> fen <id> <fen>
+#   stats [id]          -> stats of the game, or of the server
+#   close <id>          -> closed <id>
+# A finished game sends over <id> <result> <termination>, a wrong command gives error <message>.
+
+###############
+### Classes ###
+###############
+
+class GameSession:
+
+    # A game hosted by the server, with the latencies of the engine answers
+
+    __slots__ = ('game', 'thinking', 'answers', 'total_latency', 'max_latency')
+
+    def __init__(self, game:Game) -> None:
+        self.game = game
+        self.thinking = False
+        self.answers = 0
+        self.total_latency = 0.
+        self.max_latency = 0.
+
+    def add_latency(self, latency:float) -> None:
+        self.answers += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+class GameServer:
+
+    # Games of every connection are played in the event loop, only the searches go to the executor,
+    # so one process serves as many games as the workers can think for
+
+    def __init__(self, executor:Executor, max_depth:int=DEFAULT_DEPTH, max_nodes:int=None, max_time:float=None) -> None:
+        self.executor = executor
+        self.limits = (max_depth, max_nodes, max_time)
+        self.sessions:dict[int,GameSession] = {}
+        self.next_id = 1
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.answers = 0
+        # The event loop only keeps weak references to the tasks
+        self.tasks:set[asyncio.Task] = set()
+
+    async def handle_client(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+
+        # The games created by a connection are closed with it
+        owned:set[int] = set()
+        try:
+            while line := await reader.readline():
+                reply = self.command(line.decode(errors='replace').split(), writer, owned)
+                if reply:
+                    writer.write(reply.encode() + b'\n')
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for game_id in owned:
+                self.sessions.pop(game_id, None)
+            writer.close()
+
+    def command(self, tokens:list[str], writer:asyncio.StreamWriter, owned:set[int]) -> str:
+
+        # Run one command and return the line to send back (the engine answers are sent later)
+        if not tokens:
+            return ''
+        name, args = tokens[0], tokens[1:]
+        if name == 'new':
+            try:
+                game = Game(' '.join(args) if args else STARTING_FEN)
+            except ValueError as error:
+                return f'error {error}'
+            game_id, self.next_id = self.next_id, self.next_id + 1
+            self.sessions[game_id] = GameSession(game)
+            owned.add(game_id)
+            return f'game {game_id} {to_fen(game.position)}'
+        if name == 'stats' and not args:
+            return self.stats()
+
+        if not args or not args[0].isdigit() or int(args[0]) not in owned:
+            return f'error unknown game in {" ".join(tokens)!r}'
+        game_id = int(args[0])
+        session = self.sessions[game_id]
+        game = session.game
+
+        if name == 'move':
+            if session.thinking:
+                return f'error {game_id} the engine is thinking'
+            try:
+                san = game.play_name(args[1] if len(args) > 1 else '')
+            except ValueError as error:
+                return f'error {game_id} {error}'
+            reply = f'played {game_id} {san}'
+            if game.over:
+                return f'{reply}\nover {game_id} {game.result} {game.termination}'
+            self._think(game_id, session, writer)
+            return reply
+        if name == 'go':
+            if session.thinking or game.over:
+                return f'error {game_id} the engine cannot play now'
+            self._think(game_id, session, writer)
+            return ''
+        if name == 'fen':
+            return f'fen {game_id} {to_fen(game.position)}'
+        if name == 'stats':
+            mean = session.total_latency / session.answers if session.answers else 0.
+            return (f'stats {game_id} plies {len(game.moves)} answers {session.answers} '
+                    f'latency mean {1000 * mean:.1f} max {1000 * session.max_latency:.1f}')
+        if name == 'close':
+            owned.discard(game_id)
+            del self.sessions[game_id]
+            return f'closed {game_id}'
+        return f'error unknown command {name!r}'
+
+    def _think(self, game_id:int, session:GameSession, writer:asyncio.StreamWriter) -> None:
+        session.thinking = True
+        task = asyncio.get_running_loop().create_task(self._answer(game_id, session, writer, time.perf_counter()))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _answer(self, game_id:int, session:GameSession, writer:asyncio.StreamWriter, received:float) -> None:
+
+        # The search runs in the executor on a rebuilt position, the game is only touched by the event loop
+        game = session.game
+        try:
+            loop = asyncio.get_running_loop()
+            mv, _ = await loop.run_in_executor(self.executor, _think_task, game.start_fen, game.moves[:], *self.limits)
+            if self.sessions.get(game_id) is not session:
+                return # closed while the engine was thinking
+            san = game.play(mv)
+        finally:
+            session.thinking = False
+
+        latency = time.perf_counter() - received
+        session.add_latency(latency)
+        self.latencies.append(latency)
+        self.answers += 1
+        reply = f'bestmove {game_id} {move_name(mv)} {san} {1000 * latency:.1f}'
+        if game.over:
+            reply += f'\nover {game_id} {game.result} {game.termination}'
+        if not writer.is_closing():
+            writer.write(reply.encode() + b'\n')
+
+    def stats(self) -> str:
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return f'stats games {len(self.sessions)} answers 0'
+        def percentile(share:float) -> float:
+            return 1000 * latencies[min(int(share * len(latencies)), len(latencies) - 1)]
+        return (f'stats games {len(self.sessions)} answers {self.answers} latency p50 {percentile(0.5):.1f} '
+                f'p90 {percentile(0.9):.1f} p99 {percentile(0.99):.1f} max {1000 * latencies[-1]:.1f}')
+
+#################
+### Functions ###
+#################
+
+def _think_task(fen:str, moves:list[int], max_depth:int, max_nodes:int, max_time:float) -> tuple[int,int]:
+    # Run in a worker process : the moves are replayed so that the search sees the repetitions of the game
+    position = from_fen(fen)
+    for mv in moves:
+        move(mv, position)
+    return Search(position, max_depth, max_nodes, max_time).run()
+
+async def serve(server:GameServer, host:str='127.0.0.1', port:int=DEFAULT_PORT, path:str=None) -> None:
+    if path is not None:
+        listener = await asyncio.start_unix_server(server.handle_client, path)
+    else:
+        listener = await asyncio.start_server(server.handle_client, host, port)
+    async with listener:
+        await listener.serve_forever()
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Host games against the engine on a local socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', help='path of a Unix socket to listen on instead of TCP')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes running the searches')
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    parser.add_argument('--nodes', type=int)
+    parser.add_argument('--time', type=float, help='seconds per engine move')
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        server = GameServer(executor, args.depth, args.nodes, args.time)
+        try:
+            asyncio.run(serve(server, args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            print(server.stats())
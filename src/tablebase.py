@@ -0,0 +1,504 @@
+import argparse
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations_with_replacement
+
+from numpy import arange, flatnonzero, full, int8, int16, int64, memmap, minimum, maximum, ndarray, ones, uint64, where, zeros
+from numpy import array as np_array
+
+from position import *
+
+#################
+### CONSTANTS ###
+#################
+
+# A table holds one signed byte per position and player to move, seen by the player to move :
+#   v > 0  : win, mate in v plies
+#   v < 0  : loss, mated in -v - 1 plies (-1 is checkmate)
+#   0      : draw
+#   INVALID: impossible position (two pieces on a square, pawn on the first/last rank, king en prise)
+INVALID = -128
+MAX_PLIES = 126
+
+MAX_PIECES = 4
+TABLE_EXTENSION = '.tb'
+# Magic, table name, number of positions per player to move
+HEADER = struct.Struct('<4s16sQ')
+MAGIC = b'CPTB'
+
+# Positions handled at once by the generator, to bound the memory of the vectorized steps
+CHUNK = 1 << 18
+
+SYMBOLS = {QUEEN: 'Q', ROOK: 'R', BISHOP: 'B', NIGHT: 'N', PAWN: 'P'}
+SYMBOL_TYPES = {symbol: piece_type for piece_type, symbol in SYMBOLS.items()}
+
+ONE = uint64(1)
+
+#####################
+### NUMPY TABLES ###
+#####################
+
+def _padded(rows:list[tuple]):
+    width = max(len(row) for row in rows)
+    return np_array([list(row) + [-1] * (width - len(row)) for row in rows], dtype=int64)
+
+# Destinations of each piece type on an empty board, padded with -1
+DEST = {
+    NIGHT: _padded(KNIGHT_SQUARES),
+    KING: _padded(KING_SQUARES),
+    BISHOP: _padded([sum((RAY_SQUARES[d][sq] for d in BISHOP_DIRECTIONS), ()) for sq in range(NB_SQUARES)]),
+    ROOK: _padded([sum((RAY_SQUARES[d][sq] for d in ROOK_DIRECTIONS), ()) for sq in range(NB_SQUARES)]),
+    QUEEN: _padded([sum((RAY_SQUARES[d][sq] for d in QUEEN_DIRECTIONS), ()) for sq in range(NB_SQUARES)]),
+}
+SLIDERS = (BISHOP, ROOK, QUEEN)
+
+# REACH[type][from, to] : the piece attacks `to` from `from` on an empty board
+REACH = {}
+for _type, _dest in DEST.items():
+    REACH[_type] = zeros((NB_SQUARES, NB_SQUARES), dtype=bool)
+    for _sq in range(NB_SQUARES):
+        REACH[_type][_sq, _dest[_sq][_dest[_sq] >= 0]] = True
+
+PAWN_DEST = [_padded([tuple(squares_of(PAWN_ATTACKS[color][sq])) or (-1,) for sq in range(NB_SQUARES)]) for color in (WHITE, BLACK)]
+PAWN_REACH = [zeros((NB_SQUARES, NB_SQUARES), dtype=bool) for _ in (WHITE, BLACK)]
+for _color in (WHITE, BLACK):
+    for _sq in range(NB_SQUARES):
+        for _to in squares_of(PAWN_ATTACKS[_color][_sq]):
+            PAWN_REACH[_color][_sq, _to] = True
+
+BETWEEN_ARRAY = np_array(BETWEEN, dtype=uint64)
+
+# The 8 symmetries of the board as square permutations : flip the rank, flip the file, swap rank and file
+SYMMETRIES = np_array([[((j if swap else i) ^ (7 * flip_i)) * 8 + ((i if swap else j) ^ (7 * flip_j))
+                        for i in range(8) for j in range(8)]
+                       for swap in (0, 1) for flip_i in (0, 1) for flip_j in (0, 1)], dtype=int64)
+IDENTITY, FLIP_FILE = 0, 1
+
+# The white king is kept in the a1-d1-d4 triangle without pawns, on the a-d files with pawns
+TRIANGLE = [sq for sq in range(NB_SQUARES) if (sq & 7) <= 3 and 7 - (sq >> 3) <= (sq & 7)]
+QUEENSIDE = [sq for sq in range(NB_SQUARES) if (sq & 7) <= 3]
+
+def _canonical(kept:list[int], transforms:list[int]) -> tuple:
+    # Transform bringing each square in the kept set, and index of each kept square (-1 for the others)
+    transform_of = np_array([next(t for t in transforms if SYMMETRIES[t][sq] in kept) for sq in range(NB_SQUARES)], dtype=int64)
+    index_of = full(NB_SQUARES, -1, dtype=int64)
+    index_of[kept] = arange(len(kept))
+    return np_array(kept, dtype=int64), transform_of, index_of
+
+CANONICAL = {False: _canonical(TRIANGLE, list(range(8))), True: _canonical(QUEENSIDE, [IDENTITY, FLIP_FILE])}
+
+###############
+### Classes ###
+###############
+
+class Table:
+
+    # Layout of the table of a material : slot 0 is the white king, slot 1 the black king, then the white
+    # pieces and the black ones. The index is (canonical white king, square of each other slot) in base 64.
+
+    def __init__(self, name:str) -> None:
+
+        self.name = name
+        white, black = name.split('v')
+        self.codes = ([piece_code(WHITE, KING), piece_code(BLACK, KING)]
+                      + [piece_code(WHITE, SYMBOL_TYPES[symbol]) for symbol in white[1:]]
+                      + [piece_code(BLACK, SYMBOL_TYPES[symbol]) for symbol in black[1:]])
+        self.has_pawns = 'P' in name
+        if 'P' in white and 'P' in black:
+            raise ValueError(f'{name} : tables with pawns on both sides are not supported (en passant)')
+        self.kings, self.transform_of, self.index_of = CANONICAL[self.has_pawns]
+        self.size = len(self.kings) * NB_SQUARES ** (len(self.codes) - 1)
+
+    def decode(self, index) -> list:
+        squares = []
+        for _ in range(len(self.codes) - 1):
+            squares.append(index & 63)
+            index = index >> 6
+        return [self.kings[index]] + squares[::-1]
+
+    def encode(self, squares:list):
+        # Index of positions given by the squares of each slot, they are first brought to the canonical side
+        rows = self.transform_of[squares[0]]
+        index = self.index_of[SYMMETRIES[rows, squares[0]]]
+        for sq in squares[1:]:
+            index = (index << 6) | SYMMETRIES[rows, sq]
+        return index
+
+class Tablebase:
+
+    # Tables of a directory, mapped in memory the first time they are probed
+
+    def __init__(self, directory:str) -> None:
+        self.directory = directory
+        self.tables:dict[str,memmap] = {}
+        names = [file[:-len(TABLE_EXTENSION)] for file in os.listdir(directory) if file.endswith(TABLE_EXTENSION)]
+        self.names = set(names)
+        self.max_pieces = max((len(name) - 1 for name in names), default=0)
+
+    def __contains__(self, name:str) -> bool:
+        return name in self.names or name in self.tables
+
+    def __getitem__(self, name:str) -> memmap:
+        if name not in self.tables:
+            if name not in self.names:
+                raise KeyError(name)
+            self.tables[name] = load_table(os.path.join(self.directory, name + TABLE_EXTENSION))
+        return self.tables[name]
+
+    def __setitem__(self, name:str, values:ndarray) -> None:
+        # Table being generated, looked up like the others
+        self.tables[name] = values
+
+    def probe(self, position:Position) -> tuple[int,int]:
+
+        # (1 win / 0 draw / -1 loss, plies to mate) for the player to move, None when the position is not in the tables.
+        # Castling rights and en passant squares are never part of a table.
+        occ = position.occupancy[BOTH]
+        if popcount(occ) > self.max_pieces or position.castling or position.ep != NO_SQUARE:
+            return None
+        codes = [position.squares[sq] for sq in squares_of(occ)]
+        squares = [np_array([sq], dtype=int64) for sq in squares_of(occ)]
+        try:
+            value = int(lookup(codes, squares, position.turn, self)[0])
+        except KeyError:
+            return None
+        if value == INVALID:
+            return None
+        if value > 0:
+            return 1, value
+        if value < 0:
+            return -1, -value - 1
+        return 0, 0
+
+#################
+### Functions ###
+#################
+
+###########################
+###### Sub functions ######
+###########################
+
+_SLOTS_CACHE:dict[tuple,tuple] = {}
+
+def material_name(codes) -> tuple[str,bool]:
+
+    # Name of the table of a set of pieces (like KRvKB) and if the colors must be swapped to use it :
+    # the side with more (then stronger) pieces is white in the table
+    sides = [sorted((code % 6 for code in codes if code // 6 == color and code % 6 != KING), reverse=True) for color in (WHITE, BLACK)]
+    keys = [(len(side), side) for side in sides]
+    flipped = keys[BLACK] > keys[WHITE]
+    if flipped:
+        sides.reverse()
+    return 'v'.join('K' + ''.join(SYMBOLS[piece_type] for piece_type in side) for side in sides), flipped
+
+def _slots(codes:tuple) -> tuple:
+    # Table, colors swapped or not, and the slot of `codes` that goes in each slot of the table
+    if codes not in _SLOTS_CACHE:
+        name, flipped = material_name(codes)
+        table = Table(name)
+        own = [code % 6 + 6 * (1 - code // 6) for code in codes] if flipped else list(codes)
+        order, used = [], set()
+        for code in table.codes:
+            slot = next(index for index, other in enumerate(own) if other == code and index not in used)
+            used.add(slot)
+            order.append(slot)
+        _SLOTS_CACHE[codes] = table, flipped, order
+    return _SLOTS_CACHE[codes]
+
+def lookup(codes:list[int], squares:list, turn, tables):
+
+    # Values of positions given by piece codes and the squares of each piece (arrays), in the tables
+    # found in `tables` (a dict or a Tablebase). The value is seen by the player to move (`turn`).
+    table, flipped, order = _slots(tuple(codes))
+    squares = [squares[slot] for slot in order]
+    if flipped:
+        squares = [sq ^ 56 for sq in squares]
+        turn = 1 - turn
+    return tables[table.name][turn, table.encode(squares)]
+
+def _occupancy(squares:list):
+    occ = zeros(len(squares[0]), dtype=uint64)
+    for sq in squares:
+        occ |= ONE << sq.astype(uint64)
+    return occ
+
+def _attacked(codes:list[int], squares:list, occ, color:int, target):
+    # Positions where a piece of `color` attacks the target squares
+    hit = zeros(len(target), dtype=bool)
+    for code, sq in zip(codes, squares):
+        if code // 6 != color:
+            continue
+        piece_type = code % 6
+        if piece_type == PAWN:
+            hit |= PAWN_REACH[color][sq, target]
+        elif piece_type in SLIDERS:
+            hit |= REACH[piece_type][sq, target] & ((BETWEEN_ARRAY[sq, target] & occ) == 0)
+        else:
+            hit |= REACH[piece_type][sq, target]
+    return hit
+
+def _successors(codes:list[int], squares:list, occ, color:int, tables, table:Table=None, index=None):
+
+    # Yield (exists, values) for every move slot of the player `color` : the positions where the move
+    # exists, and the value of the position reached (seen by the opponent, INVALID if the move is illegal).
+    # When the table and the indices of the positions are given, quiet moves of any piece but the white king
+    # stay in the same table with the same canonical king : the index is only shifted.
+    size = len(occ)
+    own = zeros(size, dtype=uint64)
+    for code, sq in zip(codes, squares):
+        if code // 6 == color:
+            own |= ONE << sq.astype(uint64)
+    enemy_king = squares[1 - color] # slots 0 and 1 hold the kings
+    opponents = [slot for slot, code in enumerate(codes) if code // 6 != color and code % 6 != KING]
+
+    def reached(slot:int, to, exists, new_code:int=None):
+        # Split the move between quiet arrivals and captures, each one is looked up in its table
+        quiet = exists.copy()
+        for captured in opponents:
+            taken = exists & (to == squares[captured])
+            quiet &= ~taken
+            if taken.any():
+                selected = flatnonzero(taken)
+                kept = [index for index in range(len(codes)) if index != captured]
+                new_codes = [new_code if index == slot and new_code is not None else codes[index] for index in kept]
+                new_squares = [to[selected] if index == slot else squares[index][selected] for index in kept]
+                values = full(size, INVALID, dtype=int16)
+                values[selected] = lookup(new_codes, new_squares, 1 - color, tables)
+                yield taken, values
+        if quiet.any() and table is not None and slot and new_code is None:
+            shift = 6 * (len(codes) - 1 - slot)
+            moved = index + ((to - squares[slot]) << shift)
+            yield quiet, tables[table.name][1 - color, where(quiet, moved, index)].astype(int16)
+        elif quiet.any():
+            new_codes = [new_code if index == slot and new_code is not None else code for index, code in enumerate(codes)]
+            new_squares = [where(quiet, to, sq) if index == slot else sq for index, sq in enumerate(squares)]
+            values = lookup(new_codes, new_squares, 1 - color, tables).astype(int16)
+            yield quiet, values
+
+    for slot, code in enumerate(codes):
+        if code // 6 != color:
+            continue
+        piece_type = code % 6
+        frm = squares[slot]
+
+        if piece_type == PAWN:
+            step = -8 if color == WHITE else 8
+            last = 0 if color == WHITE else 7
+            push = frm + step
+            empty = ((occ >> push.astype(uint64)) & ONE) == 0
+            promotes = (push >> 3) == last
+            yield from reached(slot, push, empty & ~promotes)
+            double = frm + 2 * step
+            start = (frm >> 3) == (6 if color == WHITE else 1)
+            safe_double = where(start, double, frm)
+            yield from reached(slot, safe_double, empty & start & (((occ >> safe_double.astype(uint64)) & ONE) == 0))
+            for promotion in PROMOTIONS:
+                yield from reached(slot, push, empty & promotes, piece_code(color, promotion))
+            for column in range(PAWN_DEST[color].shape[1]):
+                to = PAWN_DEST[color][frm, column]
+                exists = to >= 0
+                to = where(exists, to, frm)
+                capture = exists & ~(to == enemy_king)
+                capture &= (((occ & ~own) >> to.astype(uint64)) & ONE) == 1
+                promotes = (to >> 3) == last
+                yield from reached(slot, to, capture & ~promotes)
+                for promotion in PROMOTIONS:
+                    yield from reached(slot, to, capture & promotes, piece_code(color, promotion))
+            continue
+
+        destinations = DEST[piece_type][frm]
+        for column in range(destinations.shape[1]):
+            to = destinations[:, column]
+            exists = to >= 0
+            to = where(exists, to, frm)
+            exists &= (((own >> to.astype(uint64)) & ONE) == 0) & (to != enemy_king)
+            if piece_type in SLIDERS:
+                exists &= (BETWEEN_ARRAY[frm, to] & occ) == 0
+            yield from reached(slot, to, exists)
+
+############################
+###### Main functions ######
+############################
+
+def sub_tables(name:str) -> list[str]:
+    # Tables reached from a material by a capture or a promotion
+    table = Table(name)
+    found = set()
+    for slot, code in enumerate(table.codes[2:], start=2):
+        kept = table.codes[:slot] + table.codes[slot + 1:]
+        found.add(material_name(kept)[0])
+        if code % 6 == PAWN:
+            for promotion in PROMOTIONS:
+                promoted = table.codes[:slot] + [piece_code(code // 6, promotion)] + table.codes[slot + 1:]
+                found.add(material_name(promoted)[0])
+    return sorted(found)
+
+def all_tables(max_pieces:int=MAX_PIECES) -> list[str]:
+    # Every supported material up to max_pieces pieces, kings included, smallest ones first
+    names = set()
+    types = list(SYMBOLS)
+    for count in range(max_pieces - 1):
+        for pieces in combinations_with_replacement(types, count):
+            for mask in range(1 << count):
+                codes = [piece_code(WHITE, KING), piece_code(BLACK, KING)]
+                codes += [piece_code((mask >> index) & 1, piece_type) for index, piece_type in enumerate(pieces)]
+                name, _ = material_name(codes)
+                white, black = name.split('v')
+                if not ('P' in white and 'P' in black):
+                    names.add(name)
+    return sorted(names, key=lambda name: (len(name), name))
+
+def generate(name:str, tables) -> ndarray:
+
+    # Retrograde analysis of one material, the tables reached by captures and promotions must be in `tables`.
+    # Every round looks at the positions not solved yet : a position is won in n plies if a move reaches a
+    # position lost in n - 1 plies, lost in n plies if every move reaches a position won in at most n - 1 plies.
+    table = Table(name)
+    codes = table.codes
+    values = zeros((2, table.size), dtype=int8)
+    solved = zeros((2, table.size), dtype=bool)
+
+    # Impossible positions
+    for start in range(0, table.size, CHUNK):
+        index = arange(start, min(start + CHUNK, table.size), dtype=int64)
+        squares = table.decode(index)
+        valid = ones(len(index), dtype=bool)
+        for first in range(len(squares)):
+            for second in range(first + 1, len(squares)):
+                valid &= squares[first] != squares[second]
+        for code, sq in zip(codes, squares):
+            if code % 6 == PAWN:
+                valid &= ((sq >> 3) != 0) & ((sq >> 3) != 7)
+        occ = _occupancy(squares)
+        for color in (WHITE, BLACK):
+            # The player to move cannot take the king
+            invalid = ~valid | _attacked(codes, squares, occ, color, squares[1 - color])
+            values[color, index[invalid]] = INVALID
+            solved[color, index[invalid]] = True
+    tables[name] = values
+
+    longest = 0
+    for sub in sub_tables(name):
+        sub_values = tables[sub]
+        longest = max(longest, int(abs(sub_values[sub_values != INVALID].astype(int16)).max(initial=0)))
+
+    plies, last_change = 0, 0
+    while plies <= max(last_change, longest) + 1:
+        if plies > MAX_PLIES:
+            raise ValueError(f'{name} : mates longer than {MAX_PLIES} plies do not fit in the table')
+        for color in (WHITE, BLACK):
+            todo = flatnonzero(~solved[color])
+            for start in range(0, len(todo), CHUNK):
+                index = todo[start:start + CHUNK]
+                squares = table.decode(index)
+                occ = _occupancy(squares)
+
+                size = len(index)
+                has_move = zeros(size, dtype=bool)
+                all_won = ones(size, dtype=bool)
+                shortest_win = full(size, MAX_PLIES + 2, dtype=int16)
+                longest_loss = zeros(size, dtype=int16)
+                for exists, reached in _successors(codes, squares, occ, color, tables, table, index):
+                    legal = exists & (reached != INVALID)
+                    has_move |= legal
+                    # The opponent is lost : we win one ply later
+                    shortest_win = minimum(shortest_win, where(legal & (reached < 0), -reached, MAX_PLIES + 2))
+                    all_won &= ~legal | (reached > 0)
+                    longest_loss = maximum(longest_loss, where(legal, reached, 0))
+
+                if plies == 0:
+                    stuck = ~has_move
+                    in_check = _attacked(codes, squares, occ, 1 - color, squares[color])
+                    values[color, index[stuck & in_check]] = -1 # checkmate
+                    solved[color, index[stuck]] = True # stalemate stays a draw
+                    continue
+
+                won = shortest_win == plies
+                lost = has_move & all_won & (longest_loss + 1 == plies) & ~won
+                values[color, index[won]] = plies
+                values[color, index[lost]] = -(plies + 1)
+                solved[color, index[won | lost]] = True
+                if won.any() or lost.any():
+                    last_change = plies
+        plies += 1
+    return values
+
+def save_table(name:str, values, directory:str) -> str:
+    path = os.path.join(directory, name + TABLE_EXTENSION)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, name.encode(), values.shape[1]))
+        file.write(values.tobytes())
+    return path
+
+def load_table(path:str) -> memmap:
+    # The table is mapped in memory, only the pages of the probed positions are read
+    with open(path, 'rb') as file:
+        magic, name, size = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a tablebase file')
+    return memmap(path, dtype=int8, mode='r', offset=HEADER.size, shape=(2, size))
+
+def _generate_task(name:str, directory:str) -> str:
+    # Run in a worker process : the tables it depends on are read from the directory
+    start = time.perf_counter()
+    values = generate(name, Tablebase(directory))
+    save_table(name, values, directory)
+    valid = values[values != INVALID]
+    return (f'{name:<8} {values.size:>10} positions  {(valid > 0).sum():>9} wins  {(valid == 0).sum():>9} draws  '
+            f'{(valid < 0).sum():>9} losses  longest mate {int(valid.max(initial=0))} plies  {time.perf_counter() - start:.1f}s')
+
+def generate_all(names:list[str], directory:str, workers:int=1, verbose:bool=True) -> None:
+
+    # Generate the tables and the ones they depend on, the tables already on disk are reused.
+    # Tables whose sub-tables are all written are independent : each round generates them in a process pool.
+    os.makedirs(directory, exist_ok=True)
+    needed, stack = set(), list(names)
+    while stack:
+        name = stack.pop()
+        if name not in needed:
+            needed.add(name)
+            stack += sub_tables(name)
+    todo = needed - Tablebase(directory).names
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while todo:
+            ready = sorted(name for name in todo if not todo.intersection(sub_tables(name)))
+            if executor is None:
+                reports = (_generate_task(name, directory) for name in ready)
+            else:
+                reports = executor.map(_generate_task, ready, [directory] * len(ready))
+            for report in reports:
+                if verbose:
+                    print(report)
+            todo.difference_update(ready)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Generate endgame tables by retrograde analysis, or probe them')
+    parser.add_argument('--directory', default='tablebases', help='directory of the tables')
+    parser.add_argument('--generate', nargs='*', metavar='TABLE', help='tables to generate (like KQvK), all of them up to --pieces if none')
+    parser.add_argument('--pieces', type=int, default=3, help=f'number of pieces (at most {MAX_PIECES}) when generating all tables')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes generating independent tables')
+    parser.add_argument('--fen', help='position to probe')
+    args = parser.parse_args()
+
+    if args.generate is not None:
+        generate_all(args.generate or all_tables(min(args.pieces, MAX_PIECES)), args.directory, args.workers)
+    if args.fen:
+        position = from_fen(args.fen)
+        found = Tablebase(args.directory).probe(position)
+        if found is None:
+            print('position not in the tables')
+        else:
+            wdl, plies = found
+            print({1: f'win, mate in {plies} plies', 0: 'draw', -1: f'loss, mated in {plies} plies'}[wdl])
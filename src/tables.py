@@ -0,0 +1,84 @@
+#################
+### CONSTANTS ###
+#################
+
+# Attack and ray tables, built once when the module is imported (a few milliseconds).
+# Squares are numbered like the board : index = i*8 + j, a8 = 0, h1 = 63.
+
+NORTH = 0
+SOUTH = 1
+EAST = 2
+WEST = 3
+NORTH_EAST = 4
+NORTH_WEST = 5
+SOUTH_EAST = 6
+SOUTH_WEST = 7
+
+# (row step, column step) of each direction, north is toward the 8th rank
+DIRECTIONS = [(-1,0),(1,0),(0,1),(0,-1),(-1,1),(-1,-1),(1,1),(1,-1)]
+OPPOSITE = [SOUTH, NORTH, WEST, EAST, SOUTH_WEST, SOUTH_EAST, NORTH_WEST, NORTH_EAST]
+
+ROOK_DIRECTIONS = (NORTH, SOUTH, EAST, WEST)
+BISHOP_DIRECTIONS = (NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST)
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+# Along these directions the square index grows, so the first piece met is the least significant bit
+INCREASING = (SOUTH, EAST, SOUTH_EAST, SOUTH_WEST)
+
+KNIGHT_STEPS = [(2,-1),(2,1),(1,2),(-1,2),(-2,1),(-2,-1),(-1,-2),(1,-2)]
+KING_STEPS = [(1,1),(-1,1),(-1,-1),(1,-1),(0,1),(0,-1),(1,0),(-1,0)]
+
+#################
+### Functions ###
+#################
+
+def _on_board(i:int, j:int) -> bool:
+    return -1 < i < 8 and -1 < j < 8
+
+def _step_squares(steps:list[tuple]) -> list[tuple]:
+    return [tuple((i+di)*8 + j+dj for di, dj in steps if _on_board(i+di, j+dj)) for i in range(8) for j in range(8)]
+
+def _ray_squares(direction:int) -> list[tuple]:
+    di, dj = DIRECTIONS[direction]
+    rays = []
+    for sq in range(64):
+        i, j = (sq >> 3) + di, (sq & 7) + dj
+        ray = []
+        while _on_board(i, j):
+            ray.append(i*8 + j)
+            i += di; j += dj
+        rays.append(tuple(ray))
+    return rays
+
+def _mask(squares) -> int:
+    mask = 0
+    for sq in squares:
+        mask |= 1 << sq
+    return mask
+
+##############
+### TABLES ###
+##############
+
+# Squares reached from each square, in order for the rays (closest first)
+KNIGHT_SQUARES = _step_squares(KNIGHT_STEPS)
+KING_SQUARES = _step_squares(KING_STEPS)
+RAY_SQUARES = [_ray_squares(direction) for direction in range(8)]
+
+# Same tables as bitboards
+KNIGHT_ATTACKS = [_mask(squares) for squares in KNIGHT_SQUARES]
+KING_ATTACKS = [_mask(squares) for squares in KING_SQUARES]
+RAYS = [[_mask(squares) for squares in RAY_SQUARES[direction]] for direction in range(8)]
+
+# Squares attacked by a pawn, indexed by color (0 white, 1 black) then square
+PAWN_ATTACKS = [_step_squares([(-1,-1),(-1,1)]), _step_squares([(1,-1),(1,1)])]
+PAWN_ATTACKS = [[_mask(squares) for squares in PAWN_ATTACKS[color]] for color in range(2)]
+
+# BETWEEN[a][b] : squares strictly between two aligned squares, LINE[a][b] : the whole line through them
+BETWEEN = [[0] * 64 for _ in range(64)]
+LINE = [[0] * 64 for _ in range(64)]
+for _a in range(64):
+    for _direction in range(8):
+        for _b in RAY_SQUARES[_direction][_a]:
+            BETWEEN[_a][_b] = RAYS[_direction][_a] ^ RAYS[_direction][_b] ^ (1 << _b)
+            LINE[_a][_b] = RAYS[_direction][_a] | RAYS[OPPOSITE[_direction]][_a] | (1 << _a)
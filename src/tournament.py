@@ -0,0 +1,347 @@
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+
+from epd import parse_epd, read_epd
+from game import *
+from pgn import *
+from search import *
+from uci import BUCKET_BYTES, DEFAULT_HASH_MB, TimeManager
+
+#################
+### CONSTANTS ###
+#################
+
+# Openings played when no file is given, each one twice with the colors swapped
+OPENINGS = [
+    'e4 e5 Nf3 Nc6 Bb5 a6',
+    'e4 e5 Nf3 Nc6 Bc4 Bc5',
+    'e4 c5 Nf3 d6 d4 cxd4',
+    'e4 e6 d4 d5 Nc3 Nf6',
+    'e4 c6 d4 d5 e5 Bf5',
+    'd4 d5 c4 e6 Nc3 Nf6',
+    'd4 Nf6 c4 g6 Nc3 Bg7',
+    'd4 Nf6 c4 e6 Nc3 Bb4',
+    'c4 e5 Nc3 Nf6 g3 d5',
+    'Nf3 d5 g3 Nf6 Bg2 c6',
+]
+
+# Adjudication
+MAX_PLIES = 400          # the game is a draw once this many plies are played
+DRAW_SCORE = 10          # both players see a score within this many centipawns of 0 ...
+DRAW_PLIES = 12          # ... for this many plies in a row ...
+DRAW_START = 80          # ... after this ply : the game is adjudicated a draw
+
+# Terminations of a game added to the ones of game.py
+MATE_ADJUDICATION = 'mate adjudication'
+DRAW_ADJUDICATION = 'draw adjudication'
+MOVE_LIMIT = 'move limit'
+TIME_FORFEIT = 'time forfeit'
+
+# Games sent to the worker processes at the same time
+PENDING_PER_WORKER = 2
+
+###############
+### Classes ###
+###############
+
+class EngineConfig:
+
+    # Search settings of one player : depth, nodes and time per move, or a clock of `clock` seconds
+    # with `increment` seconds added after each move. Built from 'name=new,depth=5,tc=10+0.1,...'.
+
+    __slots__ = ('name', 'depth', 'nodes', 'movetime', 'clock', 'increment', 'mobility', 'hash_mb')
+
+    def __init__(self, name:str, depth:int=MAX_DEPTH, nodes:int=None, movetime:float=None, clock:float=None,
+                 increment:float=0., mobility:bool=False, hash_mb:int=DEFAULT_HASH_MB) -> None:
+        self.name = name
+        self.depth = depth
+        self.nodes = nodes
+        self.movetime = movetime
+        self.clock = clock
+        self.increment = increment
+        self.mobility = mobility
+        self.hash_mb = hash_mb
+
+    @classmethod
+    def parse(cls, text:str, name:str) -> 'EngineConfig':
+        config = cls(name)
+        for option in filter(None, text.split(',')):
+            key, _, value = option.partition('=')
+            if key == 'name':
+                config.name = value
+            elif key == 'depth':
+                config.depth = min(int(value), MAX_DEPTH)
+            elif key == 'nodes':
+                config.nodes = int(value)
+            elif key == 'movetime':
+                config.movetime = float(value)
+            elif key == 'tc':
+                clock, _, increment = value.partition('+')
+                config.clock, config.increment = float(clock), float(increment or 0)
+            elif key == 'mobility':
+                config.mobility = value not in ('0', 'false', 'no')
+            elif key == 'hash':
+                config.hash_mb = int(value)
+            else:
+                raise ValueError(f'unknown engine option {key!r}')
+        if config.depth == MAX_DEPTH and config.nodes is None and config.movetime is None and config.clock is None:
+            raise ValueError(f'engine {config.name!r} needs a depth, nodes, movetime or tc limit')
+        return config
+
+class Adjudication:
+
+    __slots__ = ('max_plies', 'draw_score', 'draw_plies', 'draw_start')
+
+    def __init__(self, max_plies:int=MAX_PLIES, draw_score:int=DRAW_SCORE, draw_plies:int=DRAW_PLIES, draw_start:int=DRAW_START) -> None:
+        self.max_plies = max_plies
+        self.draw_score = draw_score
+        self.draw_plies = draw_plies
+        self.draw_start = draw_start
+
+class TournamentStats:
+
+    # Wins, draws and losses of the first engine, with its Elo difference to the second one
+    # and the sequential probability ratio test of elo0 against elo1
+
+    def __init__(self, elo0:float=0., elo1:float=5., alpha:float=0.05, beta:float=0.05) -> None:
+        self.wins = self.draws = self.losses = 0
+        self.terminations:dict[str,int] = {}
+        self.elo0, self.elo1 = elo0, elo1
+        # The test stops once the log-likelihood ratio leaves [lower, upper]
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.start = time.perf_counter()
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def add(self, points:float, termination:str) -> None:
+        if points == 1:
+            self.wins += 1
+        elif points == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        self.terminations[termination] = self.terminations.get(termination, 0) + 1
+
+    def score(self) -> float:
+        return (self.wins + self.draws / 2) / self.games if self.games else 0.5
+
+    def variance(self) -> float:
+        # Variance of the points of one game
+        if not self.games:
+            return 0.
+        score = self.score()
+        return (self.wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2 + self.losses * score ** 2) / self.games
+
+    def elo(self) -> tuple[float,float]:
+        # Elo difference and the half width of its 95% interval
+        score = self.score()
+        margin = 1.96 * math.sqrt(self.variance() / self.games) if self.games else 0.
+        return elo_from_score(score), (elo_from_score(score + margin) - elo_from_score(score - margin)) / 2
+
+    def llr(self) -> float:
+        # Log-likelihood ratio of elo1 against elo0, with the normal approximation of the score
+        variance = self.variance()
+        if not variance:
+            return 0.
+        score0, score1 = score_from_elo(self.elo0), score_from_elo(self.elo1)
+        return self.games * (score1 - score0) * (2 * self.score() - score0 - score1) / (2 * variance)
+
+    def sprt(self) -> str:
+        # 'H1' : the first engine is elo1 stronger, 'H0' : it is not, None : more games are needed
+        llr = self.llr()
+        if llr >= self.upper:
+            return 'H1'
+        if llr <= self.lower:
+            return 'H0'
+        return None
+
+    def __str__(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        elo, margin = self.elo()
+        terminations = ', '.join(f'{name} : {count}' for name, count in sorted(self.terminations.items()))
+        return (f'{self.games} games in {elapsed:.1f}s : +{self.wins} ={self.draws} -{self.losses} '
+                f'({100 * self.score():.1f}%), Elo {elo:+.1f} +/- {margin:.1f}, '
+                f'LLR {self.llr():.2f} [{self.lower:.2f}, {self.upper:.2f}] - {terminations}')
+
+#################
+### Functions ###
+#################
+
+###########################
+###### Sub functions ######
+###########################
+
+def score_from_elo(elo:float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def elo_from_score(score:float) -> float:
+    # A score of 0 or 1 has no finite Elo, it is clamped
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def opening_positions(lines) -> list[str]:
+    # FEN of each opening : a line of SAN moves from the starting position, or a FEN / EPD line
+    fens = []
+    for line in read_epd(lines):
+        if '/' in line:
+            position, _ = parse_epd(line)
+        else:
+            position = from_fen(STARTING_FEN)
+            for san in line.split():
+                move(san_to_move(position, san), position)
+        fens.append(to_fen(position))
+    return fens
+
+def _game_task(index:int, fen:str, white:EngineConfig, black:EngineConfig, adjudication:Adjudication) -> tuple[int,str,str,list[str]]:
+    # Run in a worker process
+    return (index,) + play_game(fen, white, black, adjudication)
+
+############################
+###### Main functions ######
+############################
+
+def play_game(fen:str, white:EngineConfig, black:EngineConfig, adjudication:Adjudication=None) -> tuple[str,str,list[str]]:
+
+    # Play one game between two configurations, return its result, termination and SAN moves.
+    # Each player keeps its own transposition table, move history and clock for the whole game.
+    adjudication = adjudication or Adjudication()
+    game = Game(fen)
+    position = game.position
+    configs = {WHITE: white, BLACK: black}
+    tts = {color: TranspositionTable(config.hash_mb * (1 << 20) // BUCKET_BYTES) for color, config in configs.items()}
+    orderings = {color: MoveOrdering(MAX_DEPTH) for color in configs}
+    clocks = {color: config.clock for color, config in configs.items()}
+    quiet_plies = 0
+
+    def decisive(winner:int) -> str:
+        return '1-0' if winner == WHITE else '0-1'
+
+    while not game.over:
+        if len(game.moves) >= adjudication.max_plies:
+            game.adjudicate('1/2-1/2', MOVE_LIMIT)
+            break
+
+        color = position.turn
+        config = configs[color]
+        soft = hard = config.movetime
+        if clocks[color] is not None:
+            soft, hard = TimeManager(clocks[color], config.increment).limits()
+        searcher = Search(position, config.depth, config.nodes, hard, tts[color], config.mobility, ordering=orderings[color])
+        searcher.soft_time = soft
+        start = time.perf_counter()
+        mv, score = searcher.run()
+        if clocks[color] is not None:
+            clocks[color] -= time.perf_counter() - start
+            if clocks[color] < 0:
+                game.adjudicate(decisive(1 - color), TIME_FORFEIT)
+                break
+            clocks[color] += config.increment
+
+        game.play(mv)
+        if game.over:
+            break
+        # A mate found by the search is forced : the game is over
+        if abs(score) >= MATE_SCORE - MAX_DEPTH:
+            game.adjudicate(decisive(color if score > 0 else 1 - color), MATE_ADJUDICATION)
+        quiet_plies = quiet_plies + 1 if abs(score) <= adjudication.draw_score else 0
+        if quiet_plies >= adjudication.draw_plies and len(game.moves) >= adjudication.draw_start:
+            game.adjudicate('1/2-1/2', DRAW_ADJUDICATION)
+
+    return game.result, game.termination, game.sans
+
+def run_tournament(first:EngineConfig, second:EngineConfig, openings:list[str], games:int,
+                   adjudication:Adjudication=None, workers:int=1, executor:Executor=None):
+
+    # Play the games and yield (index, white, black, fen, result, termination, moves) as they finish.
+    # Game 2k and 2k+1 play the same opening with the colors swapped. Closing the generator
+    # (after an SPRT decision) cancels the games not started yet.
+    adjudication = adjudication or Adjudication()
+    schedule = []
+    for index in range(games):
+        fen = openings[index // 2 % len(openings)]
+        white, black = (first, second) if index % 2 == 0 else (second, first)
+        schedule.append((index, fen, white, black))
+
+    if workers <= 1 and executor is None:
+        for index, fen, white, black in schedule:
+            yield (index, white, black, fen) + play_game(fen, white, black, adjudication)
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = {}
+        games_left = iter(schedule)
+        while True:
+            for index, fen, white, black in games_left:
+                pending[executor.submit(_game_task, index, fen, white, black, adjudication)] = (white, black, fen)
+                if len(pending) >= PENDING_PER_WORKER * workers:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                white, black, fen = pending.pop(future)
+                index, result, termination, moves = future.result()
+                yield index, white, black, fen, result, termination, moves
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Play games between two search configurations')
+    parser.add_argument('--first', required=True, help="settings of the tested engine, e.g. 'name=new,depth=4,mobility=1'")
+    parser.add_argument('--second', required=True, help="settings of the reference engine, e.g. 'name=old,tc=10+0.1' (also nodes, movetime, hash)")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--openings', help='file of openings, one FEN / EPD or line of SAN moves per line')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes playing the games')
+    parser.add_argument('--pgn', help='file the games are appended to')
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES, help='the game is a draw after this many plies')
+    parser.add_argument('--sprt', type=float, nargs=2, metavar=('ELO0', 'ELO1'), help='stop once the SPRT accepts one of the hypotheses')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    args = parser.parse_args()
+
+    first = EngineConfig.parse(args.first, 'first')
+    second = EngineConfig.parse(args.second, 'second')
+    if args.openings:
+        with open(args.openings, encoding='utf-8') as file:
+            openings = opening_positions(file)
+    else:
+        openings = opening_positions(OPENINGS)
+
+    stats = TournamentStats(*(args.sprt or (0., 5.)), args.alpha, args.beta)
+    output = open(args.pgn, 'a', encoding='utf-8') if args.pgn else None
+    date = time.strftime('%Y.%m.%d')
+    games = run_tournament(first, second, openings, args.games, Adjudication(args.max_plies), args.workers)
+    try:
+        for index, white, black, fen, result, termination, moves in games:
+            points = {'1-0': 1., '0-1': 0.}.get(result, 0.5)
+            stats.add(points if white is first else 1 - points, termination)
+            if output is not None:
+                headers = {'Event': f'{first.name} vs {second.name}', 'Date': date, 'Round': str(index + 1),
+                           'White': white.name, 'Black': black.name, 'FEN': fen, 'SetUp': '1', 'Termination': termination}
+                output.write(format_game(PgnGame(headers, moves, result)) + '\n')
+                output.flush()
+            print(stats, file=sys.stderr)
+            if args.sprt and stats.sprt() is not None:
+                print(f'SPRT : {stats.sprt()} accepted', file=sys.stderr)
+                break
+    finally:
+        games.close()
+        if output is not None:
+            output.close()
+    print(stats)
@@ -0,0 +1,152 @@
+from multiprocessing import shared_memory
+
+#################
+### CONSTANTS ###
+#################
+
+EXACT = 0
+LOWER = 1 # the score is at least the stored one (beta cutoff)
+UPPER = 2 # the score is at most the stored one (no move raised alpha)
+
+DEFAULT_BUCKETS = 1 << 18
+
+# Layout of an entry packed in 64 bits for the shared table
+SCORE_OFFSET = 1 << 23 # scores are stored unsigned on 24 bits
+AGE_MASK = 0xFF
+
+###############
+### Classes ###
+###############
+
+class TranspositionTable:
+
+    # Each bucket has two slots : the first one keeps the deepest (or most recent search's) entry,
+    # the second one is always replaced. An entry is (key, depth, bound, score, move, age).
+
+    def __init__(self, nb_buckets:int=DEFAULT_BUCKETS) -> None:
+
+        # Round to a power of two so that the bucket is found with a mask
+        size = 1
+        while size < nb_buckets:
+            size <<= 1
+        self.mask = size - 1
+        self.entries:list[tuple] = [None] * (2 * size)
+        self.age = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def clear(self) -> None:
+        self.entries = [None] * len(self.entries)
+        self.age = 0
+
+    def new_search(self) -> None:
+        # Entries of older searches can be replaced even if they are deeper
+        self.age += 1
+
+    def probe(self, key:int) -> tuple:
+        index = (key & self.mask) << 1
+        entries = self.entries
+        entry = entries[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = entries[index + 1]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key:int, depth:int, bound:int, score:int, move) -> None:
+
+        index = (key & self.mask) << 1
+        entries = self.entries
+        entry = (key, depth, bound, score, move, self.age)
+        deepest = entries[index]
+
+        if deepest is None or deepest[0] == key or depth >= deepest[1] or deepest[5] != self.age:
+            entries[index] = entry
+        else:
+            entries[index + 1] = entry
+
+    def hashfull(self) -> int:
+        # Per mille of the first thousand slots used by the current search
+        sample = self.entries[:1000]
+        return sum(1 for entry in sample if entry is not None and entry[5] == self.age) * 1000 // len(sample)
+
+class SharedTranspositionTable:
+
+    # Same buckets as TranspositionTable, but in shared memory so that the processes of a parallel search
+    # read each other's entries. A slot is two 64-bit words : key ^ data, then data, with data packing
+    # move | depth << 16 | bound << 24 | age << 26 | score << 34. The slots are written without lock,
+    # an entry torn by two processes writing at once no longer matches its key and is ignored.
+    # The table is pickled as the name of its memory block, each process maps the same block.
+
+    def __init__(self, nb_buckets:int=DEFAULT_BUCKETS) -> None:
+        size = 1
+        while size < nb_buckets:
+            size <<= 1
+        self.mask = size - 1
+        self.memory = shared_memory.SharedMemory(create=True, size=32 * size)
+        self.slots = self.memory.buf.cast('Q')
+        self.age = 0
+
+    def __getstate__(self) -> tuple:
+        return self.memory.name, self.mask, self.age
+
+    def __setstate__(self, state:tuple) -> None:
+        name, self.mask, self.age = state
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.slots = self.memory.buf.cast('Q')
+
+    def __len__(self) -> int:
+        return len(self.slots) >> 1
+
+    def detach(self) -> None:
+        # Unmap the block in this process, the other processes keep it
+        self.slots.release()
+        self.memory.close()
+
+    def close(self) -> None:
+        # Called by the creating process once the workers are done with the table
+        self.detach()
+        self.memory.unlink()
+
+    def clear(self) -> None:
+        self.memory.buf[:] = bytes(len(self.memory.buf))
+        self.age = 0
+
+    def new_search(self) -> None:
+        self.age += 1
+
+    def _entry(self, index:int) -> tuple:
+        data = self.slots[index + 1]
+        return (self.slots[index] ^ data, (data >> 16) & 0xFF, (data >> 24) & 3,
+                (data >> 34) - SCORE_OFFSET, data & 0xFFFF, (data >> 26) & AGE_MASK)
+
+    def probe(self, key:int) -> tuple:
+        first = (key & self.mask) << 2
+        slots = self.slots
+        for index in (first, first + 2):
+            data = slots[index + 1]
+            if data and slots[index] ^ data == key:
+                return self._entry(index)
+        return None
+
+    def store(self, key:int, depth:int, bound:int, score:int, move) -> None:
+
+        index = (key & self.mask) << 2
+        slots = self.slots
+        data = move | (depth << 16) | (bound << 24) | ((self.age & AGE_MASK) << 26) | ((score + SCORE_OFFSET) << 34)
+        deepest = slots[index + 1]
+
+        if (not deepest or slots[index] ^ deepest == key or depth >= (deepest >> 16) & 0xFF
+                or (deepest >> 26) & AGE_MASK != self.age & AGE_MASK):
+            slots[index], slots[index + 1] = key ^ data, data
+        else:
+            slots[index + 2], slots[index + 3] = key ^ data, data
+
+    def hashfull(self) -> int:
+        # Per mille of the first thousand slots used by the current search
+        slots = self.slots
+        age = self.age & AGE_MASK
+        sample = min(1000, len(self))
+        return sum(1 for index in range(1, 2 * sample, 2) if slots[index] and (slots[index] >> 26) & AGE_MASK == age) * 1000 // sample
@@ -0,0 +1,251 @@
+import sys
+import threading
+import time
+
+from search import *
+
+#################
+### CONSTANTS ###
+#################
+
+ENGINE_NAME = 'chess-py'
+ENGINE_AUTHOR = 'LouisEncinas'
+
+DEFAULT_HASH_MB = 16
+# Bytes taken by one bucket of the transposition table (two slots holding a tuple each)
+BUCKET_BYTES = 256
+
+# Time management, in seconds
+MOVE_OVERHEAD = 0.05        # kept for the communication with the GUI
+DEFAULT_MOVES_TO_GO = 30    # moves the remaining time is shared between when movestogo is not given
+MAX_TIME_SHARE = 0.5        # never plan to use more than this share of the clock on one move
+SOFT_TIME_SHARE = 0.5       # no new iteration is started past this share of the allocated time
+
+###############
+### Classes ###
+###############
+
+class TimeManager:
+
+    # Time allocated to a move from the clock of the player : a share of the remaining time plus most
+    # of the increment. The soft limit stops iterative deepening, the hard one interrupts the search.
+
+    def __init__(self, remaining:float=None, increment:float=0., moves_to_go:int=None, movetime:float=None) -> None:
+        self.remaining = remaining
+        self.increment = increment
+        self.moves_to_go = moves_to_go
+        self.movetime = movetime
+
+    def limits(self) -> tuple[float,float]:
+        # (soft, hard) in seconds, (None, None) when the search is not limited by time
+        if self.movetime is not None:
+            hard = max(self.movetime - MOVE_OVERHEAD, 0.01)
+            return hard, hard
+        if self.remaining is None:
+            return None, None
+        usable = max(self.remaining - MOVE_OVERHEAD, 0.01)
+        target = usable / (self.moves_to_go or DEFAULT_MOVES_TO_GO) + 0.8 * self.increment
+        hard = min(target, usable * MAX_TIME_SHARE)
+        return hard * SOFT_TIME_SHARE, hard
+
+class UciEngine:
+
+    # The main thread reads the commands while the search runs in its own thread,
+    # so that stop, ponderhit and isready are answered during a search
+
+    def __init__(self, output=sys.stdout) -> None:
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.position = from_fen(STARTING_FEN)
+        self.tt = TranspositionTable(DEFAULT_HASH_MB * (1 << 20) // BUCKET_BYTES)
+        self.ordering = MoveOrdering(MAX_DEPTH)
+        self.book:OpeningBook = None
+        self.tablebase:Tablebase = None
+
+        self.searcher:Search = None
+        self.thread:threading.Thread = None
+        self.pondering = False
+        self.ponder_limits = (None, None)
+        # Set when the bestmove of a ponder / infinite search may be sent (ponderhit or stop)
+        self.release = threading.Event()
+
+    def send(self, line:str) -> None:
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    ###### Commands ######
+
+    def handle(self, line:str) -> bool:
+        # Run one command, return False on quit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'id author {ENGINE_AUTHOR}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH_MB} min 1 max 1024')
+            self.send('option name Ponder type check default false')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop()
+            self.tt.clear()
+            self.ordering.clear()
+        elif command == 'position':
+            self.stop()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop()
+            self.go(args)
+        elif command == 'stop':
+            self.stop()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            self.stop()
+            return False
+        return True
+
+    def set_option(self, args:list[str]) -> None:
+        # setoption name <name> [value <value>]
+        text = ' '.join(args)
+        name, _, value = text.partition(' value ')
+        name = name.removeprefix('name ').strip().lower()
+        value = value.strip()
+        if name == 'hash':
+            self.stop()
+            self.tt = TranspositionTable(int(value) * (1 << 20) // BUCKET_BYTES)
+        elif name == 'bookfile':
+            self.book = OpeningBook(value) if value and value != '<empty>' else None
+        elif name == 'tablebasepath':
+            self.tablebase = Tablebase(value) if value and value != '<empty>' else None
+
+    def set_position(self, args:list[str]) -> None:
+        # position startpos | fen <fen> [moves <move> ...]
+        moves = args.index('moves') if 'moves' in args else len(args)
+        if args and args[0] == 'fen':
+            position = from_fen(' '.join(args[1:moves]))
+        else:
+            position = from_fen(STARTING_FEN)
+        for name in args[moves + 1:]:
+            mv = next((mv for mv in legal_moves(position) if move_name(mv) == name), None)
+            if mv is None:
+                self.send(f'info string illegal move {name}')
+                break
+            move(mv, position)
+        self.position = position
+
+    def go(self, args:list[str]) -> None:
+
+        options = {}
+        for index, token in enumerate(args):
+            if token in ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'movetime', 'depth', 'nodes', 'mate'):
+                options[token] = int(args[index + 1])
+        infinite = 'infinite' in args
+        self.pondering = 'ponder' in args
+        self.release.clear()
+
+        if self.book is not None and not infinite and not self.pondering:
+            mv = self.book.choose(self.position)
+            if mv != NULL_MOVE:
+                self.send('info string book move')
+                self.send(f'bestmove {move_name(mv)}')
+                return
+
+        white = self.position.turn == WHITE
+        remaining = options.get('wtime' if white else 'btime')
+        manager = TimeManager(remaining / 1000 if remaining is not None else None,
+                              options.get('winc' if white else 'binc', 0) / 1000,
+                              options.get('movestogo'),
+                              options['movetime'] / 1000 if 'movetime' in options else None)
+        soft, hard = manager.limits()
+        max_depth = options.get('depth', 2 * options['mate'] - 1 if 'mate' in options else MAX_DEPTH)
+
+        searcher = Search(self.position, min(max_depth, MAX_DEPTH), options.get('nodes'), tt=self.tt, tablebase=self.tablebase, ordering=self.ordering)
+        searcher.on_iteration = self.info
+        if infinite or self.pondering:
+            # The clock only runs after ponderhit
+            self.ponder_limits = (soft, hard)
+        else:
+            searcher.soft_time, searcher.max_time = soft, hard
+            self.release.set()
+
+        self.searcher = searcher
+        self.thread = threading.Thread(target=self._search, args=(searcher,), daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.searcher is not None:
+            self.searcher.stop()
+        self.release.set()
+        self.wait()
+
+    def ponderhit(self) -> None:
+        # The expected move was played : the search goes on with the time of a normal move
+        searcher = self.searcher
+        if searcher is not None and self.pondering:
+            self.pondering = False
+            soft, hard = self.ponder_limits
+            # The limits are counted from now, not from the start of the ponder search
+            elapsed = time.perf_counter() - searcher.start
+            searcher.soft_time = elapsed + soft if soft is not None else None
+            searcher.max_time = elapsed + hard if hard is not None else None
+            self.release.set()
+
+    def wait(self) -> None:
+        # Only called once the search is released, else its thread would never end
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    ###### Search thread ######
+
+    def _search(self, searcher:Search) -> None:
+        mv, _ = searcher.run()
+        # A ponder or infinite search only gives its move once released
+        self.release.wait()
+        if mv == NULL_MOVE:
+            self.send('bestmove 0000')
+            return
+        pv = searcher.best_pv
+        ponder = f' ponder {move_name(pv[1])}' if len(pv) > 1 else ''
+        self.send(f'bestmove {move_name(mv)}{ponder}')
+
+    def info(self, searcher:Search) -> None:
+        elapsed = time.perf_counter() - searcher.start
+        score = searcher.score
+        if abs(score) >= MATE_SCORE - MAX_DEPTH:
+            plies = MATE_SCORE - abs(score)
+            score_text = f'mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}'
+        else:
+            score_text = f'cp {score}'
+        nps = int(searcher.nodes / elapsed) if elapsed else 0
+        pv = ' '.join(move_name(mv) for mv in searcher.best_pv)
+        self.send(f'info depth {searcher.depth} score {score_text} nodes {searcher.nodes} nps {nps} '
+                  f'time {int(elapsed * 1000)} hashfull {self.tt.hashfull()} pv {pv}')
+
+#################
+### Functions ###
+#################
+
+def uci_loop(lines=sys.stdin, output=sys.stdout) -> None:
+    engine = UciEngine(output)
+    for line in lines:
+        if not engine.handle(line.strip()):
+            break
+    engine.stop()
+
+############
+### main ###
+############
+
+if __name__ == '__main__':
+    uci_loop()